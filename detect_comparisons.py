@@ -1,137 +1,317 @@
 import json
+import os
 import re
 import argparse
-from nltk.tokenize import sent_tokenize
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from collections import defaultdict
-import nltk
-
-# Download necessary NLTK data
-nltk.download('punkt')
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import Counter, defaultdict
+from whoosh.index import open_dir
+from whoosh.query import Or, Phrase, Term
+from yelp_data_processor import iter_json_data, iter_json_batches
+from yelp_docstore import attach_texts, open_text_store
+from yelp_name_matcher import BusinessNameMatcher
+from yelp_metrics import metrics, profiling
+from yelp_nltk import sent_tokenize, sentence_tokenizer
 
 # Define keywords that often indicate a comparison
 COMPARISON_KEYWORDS = ["better", "worse", "than", "compare", "compared", "best", "worst", "more", "less"]
 
-# Function to detect if a sentence contains a comparison
-def contains_comparison(sentence):
-    # Check if any comparison keyword is present in the sentence
-    for keyword in COMPARISON_KEYWORDS:
-        if re.search(rf"\b{keyword}\b", sentence, re.IGNORECASE):
-            return True
-    return False
+# Function to compile a list of comparison keywords into a single whole-word pattern
+def build_comparison_pattern(keywords):
+    alternation = "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+COMPARISON_PATTERN = build_comparison_pattern(COMPARISON_KEYWORDS)
+
+# Function to detect if a sentence (or a whole review) contains a comparison keyword
+def contains_comparison(sentence, comparison_pattern=COMPARISON_PATTERN):
+    return comparison_pattern.search(sentence) is not None
 
 # Function to detect if a comparison is between different businesses the reviewer has visited
-def is_comparing_with_other_businesses(sentence, business_name_to_id, current_business_id, user_business_dict, user_id):
-    # Check if any other business name is explicitly mentioned in the sentence and if the user has visited it
-    for business_name, business_id in business_name_to_id.items():
+def is_comparing_with_other_businesses(sentence, name_matcher, current_business_id, user_business_dict, user_id):
+    # Find every business name mentioned in the sentence in one pass, then keep
+    # the first one the user has visited that is explicitly named as a business
+    visited = user_business_dict.get(user_id, ())
+    for start, end, _, business_id in name_matcher.find_all(sentence):
         if (
             business_id != current_business_id and
-            business_id in user_business_dict[user_id] and
-            re.search(rf"\b{re.escape(business_name)}\b", sentence, re.IGNORECASE)
+            business_id in visited and
+            is_business_name_mentioned(sentence, start, end)
         ):
-            # Additional checks to ensure it's a proper noun and intended as a business name
-            if is_business_name_mentioned(sentence, business_name):
-                return business_id
+            return business_id
     return None
 
-# Function to determine if the business name is mentioned in a way that indicates it is a proper noun
-def is_business_name_mentioned(sentence, business_name):
+# Function to determine if the business name matched (case-insensitively) at sentence[start:end] is a proper noun
+def is_business_name_mentioned(sentence, start, end):
     # Check if the business name appears in quotes, indicating it's a proper noun
-    if re.search(rf'["“]{re.escape(business_name)}["”]', sentence):
+    if start > 0 and end < len(sentence) and sentence[start - 1] in '"“' and sentence[end] in '"”':
         return True
     # Check if the business name appears capitalized properly
-    if re.search(rf'\b{re.escape(business_name)}\b', sentence):
-        words = sentence.split()
-        for word in words:
-            if word.lower() == business_name.lower() and word[0].isupper():
-                return True
-    return False
+    return sentence[start].isupper()
 
 # Function to load business metadata
 def load_business_metadata(business_file):
     business_metadata = {}
     business_name_to_id = {}
-    with open(business_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            business = json.loads(line)
-            business_metadata[business["business_id"]] = business["name"]
-            business_name_to_id[business["name"]] = business["business_id"]
+    for business in iter_json_data(business_file, fields=("business_id", "name")):
+        business_metadata[business.get("business_id")] = business.get("name")
+        business_name_to_id[business.get("name")] = business.get("business_id")
     return business_metadata, business_name_to_id
 
 # Function to create a dictionary of businesses visited by each user
 def create_user_business_dict(review_file):
     user_business_dict = defaultdict(set)
-    with open(review_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            review = json.loads(line)
-            user_id = review.get("user_id", "")
-            business_id = review.get("business_id", "")
-            if user_id and business_id:
-                user_business_dict[user_id].add(business_id)
+    for review in iter_json_data(review_file, fields=("user_id", "business_id")):
+        user_id = review.get("user_id")
+        business_id = review.get("business_id")
+        if user_id and business_id:
+            user_business_dict[user_id].add(business_id)
     return user_business_dict
 
-# Function to process a chunk of reviews and find comparison sentences
-def process_chunk(chunk, business_metadata, business_name_to_id, user_business_dict):
+# Function to keep only the users who visited more than one business, the only ones who can compare businesses
+def prune_user_business_dict(user_business_dict):
+    return {user_id: business_ids for user_id, business_ids in user_business_dict.items() if len(business_ids) > 1}
+
+# Function to process a chunk of reviews and find comparison sentences.
+# If a stats Counter is given, it records how many reviews and sentences were scanned and skipped.
+def process_chunk(chunk, business_metadata, name_matcher, user_business_dict,
+                  comparison_pattern=COMPARISON_PATTERN, stats=None):
+    if stats is None:
+        stats = Counter()
     results = []
+    tokenize_seconds = 0.0
+    match_seconds = 0.0
     for review in chunk:
+        stats["reviews_scanned"] += 1
         review_text = review.get("text", "")
         business_id = review.get("business_id", "")
         user_id = review.get("user_id", "")
+        # Reviews by users who visited a single business cannot compare businesses
+        if len(user_business_dict.get(user_id, ())) < 2:
+            stats["reviews_skipped_single_business"] += 1
+            continue
+        # Only split reviews containing at least one comparison keyword into sentences
+        if not contains_comparison(review_text, comparison_pattern):
+            stats["reviews_skipped_no_keyword"] += 1
+            continue
         business_name_1 = business_metadata.get(business_id, "Unknown Business")
+        start = time.perf_counter()
         sentences = sent_tokenize(review_text)
+        tokenize_seconds += time.perf_counter() - start
+        stats["reviews_tokenized"] += 1
+        stats["sentences_tokenized"] += len(sentences)
 
         # Find sentences containing comparisons with other businesses
         for sentence in sentences:
-            if contains_comparison(sentence):
+            if not contains_comparison(sentence, comparison_pattern):
+                stats["sentences_skipped_no_keyword"] += 1
+            else:
+                stats["sentences_checked"] += 1
+                start = time.perf_counter()
                 compared_business_id = is_comparing_with_other_businesses(
-                    sentence, business_name_to_id, business_id, user_business_dict, user_id
+                    sentence, name_matcher, business_id, user_business_dict, user_id
                 )
+                match_seconds += time.perf_counter() - start
                 if compared_business_id:
                     compared_business_name = business_metadata.get(compared_business_id, "Unknown Business")
                     results.append({
-                        "review_id": review["review_id"],
+                        "review_id": review.get("review_id"),
                         "business_id_1": business_id,
                         "business_name_1": business_name_1,
                         "business_id_2": compared_business_id,
                         "business_name_2": compared_business_name,
                         "comparison_sentence": sentence
                     })
+    if stats["reviews_tokenized"]:
+        metrics.record("detect.sentence_tokenize", tokenize_seconds, count=stats["reviews_tokenized"])
+    if stats["sentences_checked"]:
+        metrics.record("detect.name_match", match_seconds, count=stats["sentences_checked"])
     return results
 
 # Function to read file in chunks
 def read_file_in_chunks(file_path, chunk_size=1000):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        chunk = []
-        for line in file:
-            chunk.append(json.loads(line))
-            if len(chunk) >= chunk_size:
-                yield chunk
-                chunk = []
-        if chunk:
-            yield chunk
+    fields = ("review_id", "user_id", "business_id", "text")
+    yield from iter_json_batches(file_path, chunk_size, fields=fields)
 
-# Main function to find comparisons in reviews using parallel processing
-def find_comparisons_in_reviews(review_file, business_file, output_file):
-    business_metadata, business_name_to_id = load_business_metadata(business_file)
-    user_business_dict = create_user_business_dict(review_file)
-    all_results = []
-    with ProcessPoolExecutor() as executor:
-        futures = {
-            executor.submit(process_chunk, chunk, business_metadata, business_name_to_id, user_business_dict): chunk
-            for chunk in read_file_in_chunks(review_file)
-        }
-
-        for future in as_completed(futures):
-            results = future.result()
-            all_results.extend(results)
-
-    # Write results to output JSON file
-    with open(output_file, 'w', encoding='utf-8') as outfile:
-        json.dump(all_results, outfile, indent=2)
-
-    # Print comparisons between business IDs
-    for result in all_results:
+# Function to analyze a keyword or name into index terms the same way the review text was indexed
+def analyze_terms(schema, text, fieldname="text"):
+    return list(schema[fieldname].process_text(text, mode="query"))
+
+# Function to build an index query matching any text that contains one of the comparison keywords.
+# Keywords are stemmed like the review text, so the query matches a superset of the regex pre-filter.
+def build_keyword_query(schema, keywords, fieldname="text"):
+    subqueries = []
+    for keyword in keywords:
+        terms = analyze_terms(schema, keyword, fieldname)
+        if not terms:
+            raise ValueError(f"Comparison keyword {keyword!r} is a stop word of the review index and cannot be queried")
+        subqueries.append(Term(fieldname, terms[0]) if len(terms) == 1 else Phrase(fieldname, terms))
+    return Or(subqueries)
+
+# Function to build an index query matching any text that mentions one of the business names as a phrase.
+# Names made only of stop words cannot be queried and are left out.
+def build_name_query(schema, business_names, fieldname="text"):
+    subqueries = []
+    for name in business_names:
+        terms = analyze_terms(schema, name, fieldname)
+        if terms:
+            subqueries.append(Term(fieldname, terms[0]) if len(terms) == 1 else Phrase(fieldname, terms))
+    return Or(subqueries)
+
+# Function to create the dictionary of businesses visited by each user from the review index columns
+def load_user_business_dict_from_index(reader):
+    user_ids = reader.column_reader("user_id")
+    business_ids = reader.column_reader("business_id")
+    user_business_dict = defaultdict(set)
+    for docnum in reader.all_doc_ids():
+        user_business_dict[user_ids[docnum]].add(business_ids[docnum])
+    return user_business_dict
+
+# Function to select the reviews worth splitting into sentences: they contain a comparison keyword
+# (and optionally a business name), and their author visited more than one business
+def select_candidate_reviews(searcher, user_business_dict, keyword_query, name_query=None):
+    docnums = set(searcher.docs_for_query(keyword_query))
+    if name_query is not None:
+        docnums &= set(searcher.docs_for_query(name_query))
+    user_ids = searcher.reader().column_reader("user_id")
+    return [docnum for docnum in sorted(docnums) if user_ids[docnum] in user_business_dict]
+
+# Function to read the candidate reviews from the index in chunks, taking the text from the
+# text store when the index was built in compact mode
+def read_candidates_in_chunks(searcher, docnums, chunk_size=1000, text_store=None):
+    fields = ("review_id", "user_id", "business_id", "text")
+    for start in range(0, len(docnums), chunk_size):
+        chunk = [{field: stored.get(field) for field in fields}
+                 for stored in (searcher.stored_fields(docnum) for docnum in docnums[start:start + chunk_size])]
+        yield attach_texts(text_store, chunk)
+
+# Lookup tables shared by every chunk a worker process handles
+_worker_tables = {}
+
+# Worker initializer: receive the lookup tables once per worker process instead of once per chunk
+def init_worker(business_metadata, name_matcher, user_business_dict, comparison_pattern=COMPARISON_PATTERN):
+    # Forked workers inherit the parent's metrics; start empty so merging them back does not count twice
+    metrics.reset()
+    _worker_tables["business_metadata"] = business_metadata
+    _worker_tables["name_matcher"] = name_matcher
+    _worker_tables["user_business_dict"] = user_business_dict
+    _worker_tables["comparison_pattern"] = comparison_pattern
+
+# Function run in worker processes to process a chunk with the shared lookup tables.
+# The worker's metrics are drained and returned with the results so the parent can merge them.
+def process_chunk_in_worker(chunk):
+    stats = Counter()
+    with metrics.timer("detect.process_chunk"):
+        results = process_chunk(chunk, _worker_tables["business_metadata"], _worker_tables["name_matcher"],
+                                _worker_tables["user_business_dict"], _worker_tables["comparison_pattern"], stats)
+    return results, stats, metrics.drain()
+
+# Function to write results to the output JSON array and console as they arrive
+def write_results(outfile, results, first):
+    for result in results:
+        # Match the layout of json.dump(all_results, indent=2)
+        item = json.dumps(result, indent=2).replace("\n", "\n  ")
+        outfile.write(("[\n  " if first else ",\n  ") + item)
+        first = False
         print(f"Review {result['review_id']} compares business \"{result['business_name_1']}\" with business \"{result['business_name_2']}\" in the sentence: {result['comparison_sentence']}")
+    return first
+
+# Main function to find comparisons in reviews using parallel processing
+def find_comparisons_in_reviews(review_file, business_file, output_file, max_workers=None, max_pending=None,
+                                keywords=None):
+    comparison_pattern = build_comparison_pattern(keywords) if keywords else COMPARISON_PATTERN
+    with metrics.timer("detect.load_business_metadata"):
+        business_metadata, business_name_to_id = load_business_metadata(business_file)
+    with metrics.timer("detect.build_name_matcher"):
+        name_matcher = BusinessNameMatcher(business_name_to_id)
+    with metrics.timer("detect.load_user_businesses"):
+        user_business_dict = prune_user_business_dict(create_user_business_dict(review_file))
+
+    stats = detect_in_chunks(read_file_in_chunks(review_file), output_file, business_metadata, name_matcher,
+                             user_business_dict, comparison_pattern, max_workers, max_pending)
+    for name, value in stats.items():
+        metrics.incr(f"detect.{name}", value)
+    print_stats(stats)
+    return stats
+
+# Function to find comparisons using the review index built by YelpIndexProcessor: only the candidate
+# reviews selected by index queries are read and split into sentences, instead of the whole review file.
+# Only reviews the indexer accepted are covered: reviews it quarantined (e.g. with an invalid date) are
+# missing from the index, so the results can differ from find_comparisons_in_reviews on the same data
+def find_comparisons_in_index(index_dir_review, business_file, output_file, max_workers=None, max_pending=None,
+                              keywords=None, name_phrases=False):
+    keywords = keywords or COMPARISON_KEYWORDS
+    comparison_pattern = build_comparison_pattern(keywords)
+    with metrics.timer("detect.load_business_metadata"):
+        business_metadata, business_name_to_id = load_business_metadata(business_file)
+    with metrics.timer("detect.build_name_matcher"):
+        name_matcher = BusinessNameMatcher(business_name_to_id)
+
+    ix = open_dir(index_dir_review, indexname="review_index")
+    with ix.searcher() as searcher:
+        with metrics.timer("detect.load_user_businesses"):
+            user_business_dict = prune_user_business_dict(load_user_business_dict_from_index(searcher.reader()))
+        with metrics.timer("detect.select_candidates"):
+            keyword_query = build_keyword_query(ix.schema, keywords)
+            name_query = build_name_query(ix.schema, business_name_to_id) if name_phrases else None
+            candidates = select_candidate_reviews(searcher, user_business_dict, keyword_query, name_query)
+
+        chunks = read_candidates_in_chunks(searcher, candidates, text_store=open_text_store(ix, index_dir_review))
+        stats = detect_in_chunks(chunks, output_file, business_metadata, name_matcher, user_business_dict,
+                                 comparison_pattern, max_workers, max_pending)
+        stats["reviews_in_index"] = searcher.doc_count()
+        stats["reviews_candidates"] = len(candidates)
+
+    for name, value in stats.items():
+        metrics.incr(f"detect.{name}", value)
+    print(f"Reviews in index: {stats['reviews_in_index']}")
+    print(f"Candidate reviews selected by the index: {stats['reviews_candidates']}")
+    print_stats(stats)
+    return stats
+
+# Function to run the detection over chunks of reviews in worker processes, streaming the results to output_file
+def detect_in_chunks(chunks, output_file, business_metadata, name_matcher, user_business_dict,
+                     comparison_pattern=COMPARISON_PATTERN, max_workers=None, max_pending=None):
+    # Bound the chunks in flight so the reviews are never held in memory as a whole
+    max_pending = max_pending or 2 * (max_workers or os.cpu_count() or 1)
+    # Fail here with a clear error if the NLTK data is missing, rather than in every worker
+    sentence_tokenizer()
+
+    # Lookup tables go through the initializer: inherited by forked workers, pickled once per spawned worker
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(business_metadata, name_matcher, user_business_dict,
+                                       comparison_pattern)) as executor, \
+            open(output_file, 'w', encoding='utf-8') as outfile:
+        first = True
+        stats = Counter()
+        pending = set()
+        for chunk in chunks:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results, chunk_stats, chunk_metrics = future.result()
+                    stats.update(chunk_stats)
+                    metrics.merge(chunk_metrics)
+                    first = write_results(outfile, results, first)
+            pending.add(executor.submit(process_chunk_in_worker, chunk))
+
+        for future in wait(pending).done:
+            results, chunk_stats, chunk_metrics = future.result()
+            stats.update(chunk_stats)
+            metrics.merge(chunk_metrics)
+            first = write_results(outfile, results, first)
+        outfile.write("[]" if first else "\n]")
+    return stats
+
+# Function to report how much work the keyword pre-filter saved
+def print_stats(stats):
+    print(f"Reviews scanned: {stats['reviews_scanned']}")
+    print(f"Reviews skipped (single business user): {stats['reviews_skipped_single_business']}")
+    print(f"Reviews skipped (no comparison keyword): {stats['reviews_skipped_no_keyword']}")
+    print(f"Reviews split into sentences: {stats['reviews_tokenized']}")
+    print(f"Sentences tokenized: {stats['sentences_tokenized']}")
+    print(f"Sentences skipped (no comparison keyword): {stats['sentences_skipped_no_keyword']}")
+    print(f"Sentences checked for business names: {stats['sentences_checked']}")
 
 if __name__ == "__main__":
     # Set up argument parser
@@ -139,9 +319,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "--review_file",
         type=str,
-        required=True,
+        default=None,
         help="Path to the JSON file containing reviews."
     )
+    parser.add_argument(
+        "--index_dir_review",
+        type=str,
+        default=None,
+        help="Read candidate reviews from this review index instead of scanning the review file. "
+             "Only reviews that were indexed successfully are covered; quarantined ones are skipped."
+    )
+    parser.add_argument(
+        "--name_phrases",
+        action="store_true",
+        help="With --index_dir_review, also require a business name phrase in the candidate reviews."
+    )
     parser.add_argument(
         "--business_file",
         type=str,
@@ -154,9 +346,50 @@ if __name__ == "__main__":
         required=True,
         help="Path to the output JSON file for detected comparisons."
     )
+    parser.add_argument(
+        "--keywords",
+        type=str,
+        default=None,
+        help="Comma-separated comparison keywords (defaults to the built-in list)."
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (defaults to the number of CPUs)."
+    )
+    parser.add_argument(
+        "--metrics_file",
+        type=str,
+        default=None,
+        help="Write per-stage timings and counters to this file (Prometheus text for .prom, JSON lines otherwise)."
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Write a cProfile dump of the parent process to this file."
+    )
+    parser.add_argument(
+        "--trace_memory",
+        action="store_true",
+        help="Report peak memory and the top allocation sites with tracemalloc."
+    )
 
     # Parse arguments
     args = parser.parse_args()
+    if not args.review_file and not args.index_dir_review:
+        parser.error("one of --review_file or --index_dir_review is required")
 
     # Execute main function with parsed arguments
-    find_comparisons_in_reviews(args.review_file, args.business_file, args.output_file)
+    keywords = [keyword.strip() for keyword in args.keywords.split(",") if keyword.strip()] if args.keywords else None
+    with profiling(args.profile, args.trace_memory):
+        if args.index_dir_review:
+            find_comparisons_in_index(args.index_dir_review, args.business_file, args.output_file,
+                                      max_workers=args.max_workers, keywords=keywords, name_phrases=args.name_phrases)
+        else:
+            find_comparisons_in_reviews(args.review_file, args.business_file, args.output_file,
+                                        max_workers=args.max_workers, keywords=keywords)
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+        print(f"Metrics saved to {args.metrics_file}")
@@ -1,7 +1,9 @@
+import argparse
 import os
 from yelp_index_processor import YelpIndexProcessor
 from yelp_searcher import YelpSearcher, GeoSearch
 from yelp_review_summarizer import YelpReviewSummarizer
+from yelp_metrics import metrics, profiling
 
 # Set paths
 path_business_subset = 'yelp_dataset/Nashville_business_subset.json'
@@ -16,45 +18,93 @@ search_radius_km = 0.5
 search_review_keyword = 'coffee'
 top_n = 5
 num_batch = 10  # Required: 10% of reviews
+incremental = False  # Update existing indexes in place instead of rebuilding them
+index_workers = 1  # Set above 1 to index reviews with a process pool
+index_limitmb = 128  # Memory limit per indexing worker, in MB
+quarantine_path = "rejected_records.jsonl"  # Invalid records skipped while indexing
+compact_storage = False  # Keep review text in a compressed store instead of the index's stored fields
 
 # Add user ID parameter
 user_id_for_summary = "DW6dmaJHHCz2RPHh6PuMLg"
+profile_store_path = None  # e.g. "user_profiles.db" to precompute user summaries
 
-if __name__ == "__main__":
+def run():
     if not os.path.exists(index_dir_business):
         os.makedirs(index_dir_business)
     if not os.path.exists(index_dir_review):
         os.makedirs(index_dir_review)
         
     # Create index
-    processor_index = YelpIndexProcessor(index_dir_business, index_dir_review, path_business_subset, path_review_subset)
+    processor_index = YelpIndexProcessor(index_dir_business, index_dir_review, path_business_subset, path_review_subset,
+                                         incremental=incremental, quarantine_path=quarantine_path,
+                                         compact=compact_storage)
 
     print('Indexing business data')
-    processor_index.index_business_data()
+    if incremental:
+        processor_index.update_business_data()
+    else:
+        processor_index.index_business_data()
     print('--------------------')
     print(f'Searching keyword: {search_business_keyword}')
     searcher_business = YelpSearcher(index_dir_business, indexname='business_index')
-    searcher_business.search_business(search_business_keyword)
+    business_results = searcher_business.search_business(search_business_keyword, facets=("categories",))
+    print(f"Found {business_results['total']} results for business name search:")
+    for business in business_results['hits']:
+        print(f"Business: {business['name']}, City: {business['city']}, State: {business['state']}")
+    top_categories = list(business_results['facets']['categories'].items())[:top_n]
+    print("Top categories: " + ", ".join(f"{category} ({count})" for category, count in top_categories))
     print('--------------------')
     print(f'Geospatial search: Businesses within {search_radius_km}km of {search_geo_point}')
     geo_searcher = GeoSearch(index_dir_business)
-    geo_searcher.geospatial_search(search_geo_point[0], search_geo_point[1], search_radius_km)
+    for business in geo_searcher.geospatial_search(search_geo_point[0], search_geo_point[1], search_radius_km):
+        print(f"Business: {business['name']}, Distance: {business['distance']:.2f} km")
+    print('--------------------')
+    print(f'Combined search: {search_business_keyword} within {search_radius_km}km of {search_geo_point}')
+    for business in geo_searcher.combined_search(search_business_keyword, search_geo_point[0], search_geo_point[1],
+                                                 search_radius_km, top_n=top_n):
+        print(f"Business: {business['name']}, Score: {business['score']:.3f}, Distance: {business['distance']:.2f} km")
 
     print('--------------------')
     print('Indexing review data')
-    processor_index.index_review_data_chunks(num_batch=num_batch)
+    if incremental:
+        processor_index.update_review_data()
+    elif index_workers > 1:
+        processor_index.index_review_data_parallel(num_workers=index_workers, limitmb=index_limitmb)
+    else:
+        processor_index.index_review_data_chunks(num_batch=num_batch)
     print('--------------------')
     print(f'Searching keyword: {search_review_keyword}')
     searcher_review = YelpSearcher(index_dir_review, indexname='review_index')
-    searcher_review.search_review(search_review_keyword, top_n=top_n)
+    review_results = searcher_review.search_review(search_review_keyword, top_n=top_n)
+    print(f"Found {review_results['total']} results for review search:")
+    for i, review in enumerate(review_results['hits']):
+        print(f"Rank {i + 1}, Score: {review['score']}, DocID: {review['docnum']}")
+        print(f"Review: {review['text']}\n")
 
     # Generate review distribution plot
     print('--------------------')
     print('Generating review distribution plot')
-    review_summarizer = YelpReviewSummarizer(index_dir_review, index_dir_business)
+    review_summarizer = YelpReviewSummarizer(index_dir_review, index_dir_business,
+                                             profile_store_path=profile_store_path)
     review_summarizer.plot_review_distribution()
 
     # Generate user review summary
     print('--------------------')
     print('Generating user review summary')
-    review_summarizer.print_user_review_summary(user_id_for_summary)
\ No newline at end of file
+    if profile_store_path:
+        review_summarizer.update_profile_store()
+    review_summarizer.print_user_review_summary(user_id_for_summary)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index, search and summarize the Yelp subset.")
+    parser.add_argument("--metrics_file", type=str, default=None,
+                        help="Write per-stage timers and counters here (.prom for Prometheus text, else JSON lines).")
+    parser.add_argument("--profile", type=str, default=None, help="Capture a cProfile dump to this path.")
+    parser.add_argument("--trace_memory", action="store_true", help="Report the top allocation sites with tracemalloc.")
+    args = parser.parse_args()
+
+    with profiling(args.profile, trace_memory=args.trace_memory):
+        run()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+        print(f"Metrics saved to {args.metrics_file}")
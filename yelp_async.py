@@ -0,0 +1,111 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from yelp_metrics import metrics
+from yelp_searcher import YelpSearcher, GeoSearch
+from yelp_review_summarizer import YelpReviewSummarizer
+from yelp_service import SearcherPool
+
+
+class AsyncYelpQueries:
+    """Asyncio facade running the blocking Whoosh queries on a bounded thread pool.
+
+    At most max_workers queries run at once; further calls wait on the event
+    loop, where cancelling them costs nothing. Every call takes an optional
+    timeout in seconds (defaulting to the facade's) and raises
+    asyncio.TimeoutError when it expires. A query already running in a thread
+    cannot be interrupted: it finishes in the background and its result is
+    dropped.
+    """
+
+    def __init__(self, business_searcher, review_searcher, geo_searcher, summarizer, max_workers=8, timeout=None,
+                 pools=()):
+        self.business_searcher = business_searcher
+        self.review_searcher = review_searcher
+        self.geo_searcher = geo_searcher
+        self.summarizer = summarizer
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yelp-query")
+        self._slots = asyncio.Semaphore(max_workers)
+        self.pools = pools  # SearcherPools closed with the facade
+
+    @classmethod
+    def from_index_dirs(cls, index_dir_business, index_dir_review, max_workers=8, timeout=None,
+                        profile_store_path=None):
+        """Open the indexes with one pooled searcher per worker thread, like YelpQueryService"""
+        business_pool = SearcherPool(index_dir_business, "business_index", size=max_workers)
+        review_pool = SearcherPool(index_dir_review, "review_index", size=max_workers)
+        return cls(YelpSearcher(index_dir_business, "business_index", pool=business_pool),
+                   YelpSearcher(index_dir_review, "review_index", pool=review_pool),
+                   GeoSearch(index_dir_business, pool=business_pool),
+                   YelpReviewSummarizer(index_dir_review, index_dir_business, profile_store_path=profile_store_path,
+                                        review_pool=review_pool, business_pool=business_pool),
+                   max_workers=max_workers, timeout=timeout, pools=(business_pool, review_pool))
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Run a blocking call on the thread pool and await its result"""
+        timeout = self.timeout if timeout is None else timeout
+        return await asyncio.wait_for(self._run(func, *args, **kwargs), timeout)
+
+    async def _run(self, func, *args, **kwargs):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def search_business(self, query_str, top_n=10, timeout=None, **filters):
+        return await self.run(self.business_searcher.search_business, query_str, top_n, timeout=timeout, **filters)
+
+    async def search_review(self, query_str, top_n=10, timeout=None):
+        return await self.run(self.review_searcher.search_review, query_str, top_n, timeout=timeout)
+
+    async def geospatial_search(self, lat, lon, radius_km, timeout=None):
+        return await self.run(self.geo_searcher.geospatial_search, lat, lon, radius_km, timeout=timeout)
+
+    async def nearest_search(self, lat, lon, k=10, timeout=None):
+        return await self.run(self.geo_searcher.nearest_search, lat, lon, k, timeout=timeout)
+
+    async def combined_search(self, query_str, lat, lon, radius_km, top_n=10, timeout=None):
+        return await self.run(self.geo_searcher.combined_search, query_str, lat, lon, radius_km, top_n,
+                              timeout=timeout)
+
+    async def radius_search_many(self, points, radius_km, timeout=None):
+        return await self.run(self.geo_searcher.radius_search_many, points, radius_km, timeout=timeout)
+
+    async def user_summary(self, user_id, timeout=None):
+        return await self.run(self.summarizer.get_user_review_summary, user_id, timeout=timeout)
+
+    async def page(self, business_query, review_query, user_id, top_n=10, timeout=None):
+        """Run the business search, review search and user summary of one page concurrently.
+
+        The page takes as long as its slowest part. A part that fails or times
+        out is reported under "errors" instead of failing the other parts.
+        """
+        parts = {
+            "business": self.search_business(business_query, top_n, timeout=timeout),
+            "review": self.search_review(review_query, top_n, timeout=timeout),
+            "user_summary": self.user_summary(user_id, timeout=timeout),
+        }
+        with metrics.timer("async.page"):
+            results = await asyncio.gather(*parts.values(), return_exceptions=True)
+        page = {"errors": {}}
+        for name, result in zip(parts, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if isinstance(result, Exception):
+                page[name] = None
+                page["errors"][name] = "timed out" if isinstance(result, asyncio.TimeoutError) else repr(result)
+            else:
+                page[name] = result
+        return page
+
+    def close(self):
+        """Stop the worker threads, cancelling queued calls"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for pool in self.pools:
+            pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from yelp_data_processor import iter_json_data
+from yelp_metrics import metrics
+from yelp_synthetic_data import generate_dataset, WORDS, NAME_SUFFIXES
+
+STAGES = [
+    "startup",
+    "index",
+    "search_business",
+    "search_review",
+    "geo_radius",
+    "geo_radius_batch",
+    "user_summary",
+    "detect_comparisons",
+    "detect_comparisons_index",
+]
+
+# Modules the CLI entry points and the service import at startup
+STARTUP_MODULES = ["main", "detect_comparisons", "yelp_service", "yelp_async", "yelp_review_summarizer"]
+# Dependencies that should only load when their feature is used
+HEAVY_MODULES = ["matplotlib", "nltk", "numpy"]
+
+
+def latency_summary(samples):
+    """Summarize latency samples, given in seconds, as milliseconds percentiles"""
+    ms = np.array(samples) * 1000.0
+    return {
+        "count": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def time_calls(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def bench_startup(modules=STARTUP_MODULES, runs=10):
+    """Time cold imports of the entry point modules, each in a fresh interpreter.
+
+    "process" covers the whole interpreter run, as paid by a cron job, and
+    "import" the import of the module alone. "heavy_modules" lists the
+    HEAVY_MODULES the import loaded, which should stay empty.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        script = (f"import sys, time; start = time.perf_counter(); import {module}; "
+                  f"seconds = time.perf_counter() - start; "
+                  f"print(seconds, *(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+        process_samples, import_samples = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", script], cwd=directory, check=True,
+                                    capture_output=True, text=True).stdout.split()
+            process_samples.append(time.perf_counter() - start)
+            import_samples.append(float(output[0]))
+        results[module] = {
+            "process": latency_summary(process_samples),
+            "import": latency_summary(import_samples),
+            "heavy_modules": output[1:],
+        }
+    return results
+
+
+def bench_index(business_path, review_path, work_dir, num_batch, index_workers, compact=False):
+    from yelp_index_processor import YelpIndexProcessor
+    index_dir_business = os.path.join(work_dir, "indexdir_business")
+    index_dir_review = os.path.join(work_dir, "indexdir_review")
+    processor = YelpIndexProcessor(index_dir_business, index_dir_review, business_path, review_path,
+                                   compact=compact)
+
+    start = time.perf_counter()
+    processor.index_business_data()
+    business_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if index_workers > 1:
+        processor.index_review_data_parallel(num_workers=index_workers)
+    else:
+        processor.index_review_data_chunks(num_batch=num_batch)
+    review_seconds = time.perf_counter() - start
+
+    num_businesses = processor.business_ix.doc_count()
+    num_reviews = processor.review_ix.doc_count()
+
+    # Time a full scan of the stored review fields, which compact storage keeps small
+    start = time.perf_counter()
+    with processor.review_ix.searcher() as searcher:
+        for _ in searcher.documents():
+            pass
+    scan_seconds = time.perf_counter() - start
+    return {
+        "businesses": num_businesses,
+        "business_seconds": business_seconds,
+        "businesses_per_second": num_businesses / business_seconds,
+        "reviews": num_reviews,
+        "review_seconds": review_seconds,
+        "reviews_per_second": num_reviews / review_seconds,
+        "index_workers": index_workers,
+        "compact": compact,
+        "business_index_bytes": directory_size(index_dir_business),
+        "review_index_bytes": directory_size(index_dir_review),
+        "stored_fields_scan_seconds": scan_seconds,
+    }
+
+
+def bench_detect(find_comparisons, source, business_path, output_file):
+    start = time.perf_counter()
+    stats = find_comparisons(source, business_path, output_file)
+    seconds = time.perf_counter() - start
+    with open(output_file, encoding="utf-8") as f:
+        num_comparisons = len(json.load(f))
+    return {
+        "reviews": stats.get("reviews_in_index", stats["reviews_scanned"]),
+        "seconds": seconds,
+        "reviews_per_second": stats.get("reviews_in_index", stats["reviews_scanned"]) / seconds,
+        "comparisons": num_comparisons,
+        "stats": dict(stats),
+    }
+
+
+def run_benchmarks(business_path, review_path, work_dir, stages=STAGES, num_queries=200, num_batch=10,
+                   index_workers=1, compact=False, seed=42, startup_runs=10):
+    """Run the selected benchmark stages on a dataset, returning a JSON-serializable report"""
+    rng = random.Random(seed)
+    index_dir_business = os.path.join(work_dir, "indexdir_business")
+    index_dir_review = os.path.join(work_dir, "indexdir_review")
+    results = {}
+
+    # Keep the per-row prints of the pipelines out of the benchmark output
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if "startup" in stages:
+            results["startup"] = bench_startup(runs=startup_runs)
+
+        if "index" in stages:
+            results["index"] = bench_index(business_path, review_path, work_dir, num_batch, index_workers,
+                                           compact)
+
+        if "search_business" in stages:
+            from yelp_searcher import YelpSearcher
+            searcher = YelpSearcher(index_dir_business, indexname="business_index")
+            queries = [(rng.choice(NAME_SUFFIXES),) for _ in range(num_queries)]
+            results["search_business"] = time_calls(searcher.search_business, queries)
+
+        if "search_review" in stages:
+            from yelp_searcher import YelpSearcher
+            searcher = YelpSearcher(index_dir_review, indexname="review_index")
+            queries = [(" ".join(rng.sample(WORDS, rng.randint(1, 3))), 5) for _ in range(num_queries)]
+            results["search_review"] = time_calls(searcher.search_review, queries)
+
+        if "geo_radius" in stages:
+            from yelp_searcher import GeoSearch
+            from yelp_synthetic_data import CENTER_LAT, CENTER_LON, SPREAD_DEGREES
+            geo_searcher = GeoSearch(index_dir_business)
+            points = [(CENTER_LAT + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                       CENTER_LON + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)) for _ in range(num_queries)]
+            results["geo_radius"] = {
+                f"{radius_km}km": time_calls(geo_searcher.geospatial_search,
+                                             [(lat, lon, radius_km) for lat, lon in points])
+                for radius_km in (0.5, 2.0, 10.0)
+            }
+
+        if "geo_radius_batch" in stages:
+            from yelp_searcher import GeoSearch
+            from yelp_synthetic_data import CENTER_LAT, CENTER_LON, SPREAD_DEGREES
+            geo_searcher = GeoSearch(index_dir_business)
+            geo_searcher.coordinates()  # Load the coordinate arrays outside the timings
+            points = [(CENTER_LAT + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                       CENTER_LON + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)) for _ in range(num_queries * 10)]
+            results["geo_radius_batch"] = {}
+            for radius_km in (0.5, 2.0, 10.0):
+                start = time.perf_counter()
+                geo_searcher.radius_search_many(points, radius_km)
+                seconds = time.perf_counter() - start
+                results["geo_radius_batch"][f"{radius_km}km"] = {
+                    "points": len(points), "seconds": seconds, "points_per_second": len(points) / seconds}
+
+        if "user_summary" in stages:
+            from yelp_review_summarizer import YelpReviewSummarizer
+            summarizer = YelpReviewSummarizer(index_dir_review, index_dir_business)
+            user_ids = list({review["user_id"] for review in iter_json_data(review_path, fields=("user_id",)) if review.get("user_id")})
+            sample = [(user_id,) for user_id in rng.sample(user_ids, min(num_queries // 4, len(user_ids)))]
+            results["user_summary"] = time_calls(summarizer.get_user_review_summary, sample)
+
+        if "detect_comparisons" in stages:
+            from detect_comparisons import find_comparisons_in_reviews
+            results["detect_comparisons"] = bench_detect(find_comparisons_in_reviews, review_path, business_path,
+                                                         os.path.join(work_dir, "comparison_results.json"))
+
+        if "detect_comparisons_index" in stages:
+            from detect_comparisons import find_comparisons_in_index
+            results["detect_comparisons_index"] = bench_detect(find_comparisons_in_index, index_dir_review,
+                                                               business_path,
+                                                               os.path.join(work_dir, "comparison_results.json"))
+
+    return results
+
+
+def remove_outputs(work_dir, generated):
+    """Remove the indexes and files the benchmark created, leaving anything else in work_dir alone"""
+    for name in ("indexdir_business", "indexdir_review"):
+        shutil.rmtree(os.path.join(work_dir, name), ignore_errors=True)
+    names = ["comparison_results.json"]
+    if generated:
+        names += ["synthetic_business.json", "synthetic_review.json"]
+    for name in names:
+        path = os.path.join(work_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    with contextlib.suppress(OSError):
+        os.rmdir(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark indexing, search, summaries and comparison detection.")
+    parser.add_argument("--num_reviews", type=int, default=10000,
+                        help="Number of synthetic reviews to generate (e.g. 10000 up to 10000000).")
+    parser.add_argument("--num_businesses", type=int, default=None,
+                        help="Number of synthetic businesses (defaults to num_reviews / 20).")
+    parser.add_argument("--business_file", type=str, default=None,
+                        help="Benchmark an existing business JSON file instead of synthetic data.")
+    parser.add_argument("--review_file", type=str, default=None,
+                        help="Benchmark an existing review JSON file instead of synthetic data.")
+    parser.add_argument("--work_dir", type=str, default="benchmark_workdir",
+                        help="Directory for the generated data and indexes.")
+    parser.add_argument("--output_file", type=str, default="benchmark_results.json",
+                        help="Path of the JSON report.")
+    parser.add_argument("--stages", type=str, default=",".join(STAGES),
+                        help=f"Comma-separated stages to run, from: {', '.join(STAGES)}.")
+    parser.add_argument("--num_queries", type=int, default=200, help="Queries per latency measurement.")
+    parser.add_argument("--startup_runs", type=int, default=10,
+                        help="Fresh interpreters started per module by the startup stage.")
+    parser.add_argument("--index_workers", type=int, default=1, help="Worker processes for review indexing.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Build the indexes in compact storage mode, with review text in a separate store.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and queries.")
+    parser.add_argument("--keep_work_dir", action="store_true", help="Keep the generated data and indexes.")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    os.makedirs(args.work_dir, exist_ok=True)
+    generate_seconds = None
+    try:
+        if args.business_file and args.review_file:
+            business_path, review_path = args.business_file, args.review_file
+        else:
+            start = time.perf_counter()
+            business_path, review_path = generate_dataset(args.work_dir, args.num_reviews, args.num_businesses,
+                                                          seed=args.seed)
+            generate_seconds = time.perf_counter() - start
+
+        results = run_benchmarks(business_path, review_path, args.work_dir, stages=stages,
+                                 num_queries=args.num_queries, index_workers=args.index_workers, compact=args.compact, seed=args.seed,
+                                 startup_runs=args.startup_runs)
+    finally:
+        if not args.keep_work_dir:
+            remove_outputs(args.work_dir, generated=generate_seconds is not None)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "num_reviews": args.num_reviews if generate_seconds is not None else None,
+            "business_file": args.business_file,
+            "review_file": args.review_file,
+            "num_queries": args.num_queries,
+            "startup_runs": args.startup_runs,
+            "index_workers": args.index_workers,
+            "compact": args.compact,
+            "seed": args.seed,
+            "stages": stages,
+        },
+        "generate_seconds": generate_seconds,
+        "results": results,
+        "metrics": metrics.snapshot(),
+    }
+    with open(args.output_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Benchmark results saved to {args.output_file}")
@@ -1,4 +1,63 @@
 import json
+import time
+from yelp_metrics import metrics
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library
+    _loads = json.loads
+
+READ_BUFFER_SIZE = 1 << 20  # Read the file in 1 MB blocks
+
+
+def iter_json_data(path, fields=None):
+    """Stream parsed records from a JSON lines file.
+
+    If fields is given, each record is projected onto those of the keys it
+    has, so that only the values the caller needs are kept alive. Records
+    that are not JSON objects are passed through for the caller to reject.
+    """
+    parse_seconds = 0.0
+    records = 0
+    try:
+        with open(path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                start = time.perf_counter()
+                record = _loads(line)
+                if fields is not None and isinstance(record, dict):
+                    record = {field: record[field] for field in fields if field in record}
+                parse_seconds += time.perf_counter() - start
+                records += 1
+                yield record
+    finally:
+        if records:
+            metrics.record("json.parse", parse_seconds, count=records)
+
+
+def iter_json_batches(path, batch_size, fields=None):
+    """Stream lists of at most batch_size parsed records from a JSON lines file"""
+    batch = []
+    for record in iter_json_data(path, fields):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def count_json_lines(path):
+    """Count the records in a JSON lines file without parsing them"""
+    count = 0
+    with open(path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
 
 class YelpDataProcessor:
     def __init__(self, business_subset_path, review_subset_path):
@@ -7,11 +66,7 @@ class YelpDataProcessor:
 
     def get_json_data(self, path):
         """Parse JSON file, reading line by line"""
-        data = []
-        with open(path, 'r', encoding='utf-8') as f:
-            for line in f:
-                data.append(json.loads(line))
-        return data
+        return list(iter_json_data(path))
 
     def get_business_data(self):
         """Get business data from the subset file"""
@@ -19,4 +74,20 @@ class YelpDataProcessor:
 
     def get_review_data(self):
         """Get review data from the subset file"""
-        return self.get_json_data(self.review_subset_path)
\ No newline at end of file
+        return self.get_json_data(self.review_subset_path)
+
+    def iter_business_data(self, fields=None):
+        """Stream business data from the subset file"""
+        return iter_json_data(self.business_subset_path, fields)
+
+    def iter_review_data(self, fields=None):
+        """Stream review data from the subset file"""
+        return iter_json_data(self.review_subset_path, fields)
+
+    def iter_review_batches(self, batch_size, fields=None):
+        """Stream review data from the subset file in batches"""
+        return iter_json_batches(self.review_subset_path, batch_size, fields)
+
+    def count_reviews(self):
+        """Count the reviews in the subset file"""
+        return count_json_lines(self.review_subset_path)
@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from yelp_metrics import metrics
+
+DATA_FILE = "review_text.dat"  # zlib-compressed blocks of texts
+INDEX_FILE = "review_text.idx"  # One "key<TAB>block offset<TAB>block length<TAB>slot" line per text
+
+
+def has_text_store(directory):
+    return os.path.exists(os.path.join(directory, INDEX_FILE))
+
+
+def open_text_store(ix, directory, fieldname="text"):
+    """Return the text store of an index whose text field is not stored, or None if the index stores it"""
+    field = ix.schema[fieldname] if fieldname in ix.schema else None
+    if field is None or field.stored or not has_text_store(directory):
+        return None
+    return TextStore(directory)
+
+
+def attach_texts(store, documents, key_field="review_id", fieldname="text"):
+    """Fill in the text of documents read from an index that does not store it"""
+    if store is None:
+        return documents
+    with metrics.timer("docstore.get"):
+        texts = store.get_many(document[key_field] for document in documents)
+    for document in documents:
+        document[fieldname] = texts.get(document[key_field], "")
+    return documents
+
+
+class TextStoreWriter:
+    """Append texts to a text store, compressing them in blocks of block_size texts.
+
+    The store is append-only: a key written again points to its latest text.
+    With create set, any existing store in the directory is truncated.
+    """
+
+    def __init__(self, directory, create=False, block_size=64, level=6):
+        os.makedirs(directory, exist_ok=True)
+        mode = "wb" if create else "ab"
+        self.data = open(os.path.join(directory, DATA_FILE), mode)
+        self.index = open(os.path.join(directory, INDEX_FILE), mode)
+        self.block_size = block_size
+        self.level = level
+        self.keys = []
+        self.texts = []
+
+    def add(self, key, text):
+        self.keys.append(key)
+        self.texts.append(text or "")
+        if len(self.texts) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.texts:
+            return
+        block = zlib.compress(json.dumps(self.texts).encode("utf-8"), self.level)
+        offset = self.data.tell()
+        self.data.write(block)
+        # The block must be on disk before readers can see the index lines pointing to it
+        self.data.flush()
+        self.index.write("".join(f"{key}\t{offset}\t{len(block)}\t{slot}\n" for slot, key in enumerate(self.keys)
+                                 ).encode("utf-8"))
+        self.index.flush()
+        self.keys = []
+        self.texts = []
+
+    def close(self):
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TextStore:
+    """Read texts from a text store through a memory map of the data file.
+
+    The key table is read incrementally: only index lines appended since the
+    last lookup are parsed, so a long-lived reader follows an indexer that
+    keeps appending. Recently decompressed blocks are kept in a small LRU.
+    """
+
+    def __init__(self, directory, cache_blocks=256):
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.cache_blocks = cache_blocks
+        self._lock = threading.Lock()
+        self._locations = {}  # key -> (block offset, block length, slot)
+        self._index_size = 0
+        self._map = None
+        self._map_size = 0
+        self._blocks = OrderedDict()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._locations)
+
+    def _refresh(self):
+        size = os.path.getsize(self.index_path)
+        if size > self._index_size:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_size)
+                tail = f.read(size - self._index_size)
+            # Stop at the last complete line, a writer may be in the middle of one
+            tail = tail[:tail.rfind(b"\n") + 1]
+            for line in tail.decode("utf-8").splitlines():
+                key, offset, length, slot = line.split("\t")
+                self._locations[key] = (int(offset), int(length), int(slot))
+            self._index_size += len(tail)
+
+        data_size = os.path.getsize(self.data_path)
+        if data_size != self._map_size:
+            if self._map is not None:
+                self._map.close()
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if data_size else None
+            self._map_size = data_size
+
+    def _block(self, offset, length):
+        texts = self._blocks.get(offset)
+        if texts is None:
+            texts = json.loads(zlib.decompress(self._map[offset:offset + length]))
+            self._blocks[offset] = texts
+            if len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(offset)
+        return texts
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """Return a dict of the texts of the given keys, decompressing each block once"""
+        with self._lock:
+            self._refresh()
+            by_block = defaultdict(list)
+            for key in keys:
+                location = self._locations.get(key)
+                if location is not None:
+                    by_block[location[:2]].append((key, location[2]))
+            texts = {}
+            for (offset, length), slots in by_block.items():
+                block = self._block(offset, length)
+                for key, slot in slots:
+                    texts[key] = block[slot]
+            return texts
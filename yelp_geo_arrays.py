@@ -0,0 +1,112 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+MAX_BLOCK = 1 << 21  # Distances computed at once by the batch kernels, bounds their temporary memory
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in km between points in degrees, broadcasting over NumPy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounding_boxes(groups, lats, lons, num_groups):
+    """Return a (num_groups, 4) array of (min_lat, max_lat, min_lon, max_lon) per group of points.
+
+    groups labels each point with its group in 0..num_groups-1. Groups
+    without points get (inf, -inf, inf, -inf), like min/max of no values.
+    """
+    boxes = np.empty((num_groups, 4))
+    boxes[:, 0::2] = np.inf
+    boxes[:, 1::2] = -np.inf
+    groups = np.asarray(groups, dtype=np.intp)
+    if groups.size == 0:
+        return boxes
+    order = np.argsort(groups, kind="stable")
+    groups = groups[order]
+    lats = np.asarray(lats, dtype=float)[order]
+    lons = np.asarray(lons, dtype=float)[order]
+    # Reduce each run of equal group labels in one call per statistic
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    present = groups[starts]
+    boxes[present, 0] = np.minimum.reduceat(lats, starts)
+    boxes[present, 1] = np.maximum.reduceat(lats, starts)
+    boxes[present, 2] = np.minimum.reduceat(lons, starts)
+    boxes[present, 3] = np.maximum.reduceat(lons, starts)
+    return boxes
+
+
+class CoordinateTable:
+    """Business coordinates of one index generation as NumPy arrays indexed by docnum.
+
+    Deleted documents have NaN coordinates. A copy of the live documents
+    sorted by latitude lets the batch kernels restrict each query to the
+    latitude band its radius can reach.
+    """
+
+    def __init__(self, generation, business_ids, lats, lons):
+        self.generation = generation
+        self.business_ids = business_ids
+        self.lats = lats
+        self.lons = lons
+        self.locations = {business_id: (float(lat), float(lon)) for business_id, lat, lon
+                          in zip(business_ids, lats, lons) if business_id is not None}
+        live = np.flatnonzero(~np.isnan(lats))
+        self.by_lat = live[np.argsort(lats[live], kind="stable")]
+        self.sorted_lats = lats[self.by_lat]
+
+    @classmethod
+    def from_columns(cls, reader):
+        """Read every business location from the coordinate columns of a business index"""
+        size = reader.doc_count_all()
+        business_ids = np.array(list(reader.column_reader("business_id")), dtype=object)
+        lats = np.fromiter(reader.column_reader("latitude_column"), dtype=float, count=size)
+        lons = np.fromiter(reader.column_reader("longitude_column"), dtype=float, count=size)
+        if reader.has_deletions():
+            deleted = np.ones(size, dtype=bool)
+            deleted[np.fromiter(reader.all_doc_ids(), dtype=np.intp)] = False
+            business_ids[deleted] = None
+            lats[deleted] = np.nan
+            lons[deleted] = np.nan
+        return cls(reader.generation(), business_ids, lats, lons)
+
+    @classmethod
+    def from_stored_fields(cls, reader):
+        """Read every business location from the stored fields in one pass, for indexes without the columns"""
+        size = reader.doc_count_all()
+        business_ids = np.full(size, None, dtype=object)
+        lats = np.full(size, np.nan)
+        lons = np.full(size, np.nan)
+        for docnum, fields in reader.iter_docs():
+            business_ids[docnum] = fields["business_id"]
+            lats[docnum] = fields["latitude"]
+            lons[docnum] = fields["longitude"]
+        return cls(reader.generation(), business_ids, lats, lons)
+
+    def within_many(self, lats, lons, radius_km, max_block=MAX_BLOCK):
+        """Return, for each query point, the (docnums, distances) within radius_km, nearest first"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        results = [None] * len(lats)
+        # Degrees of latitude spanned by the radius, with a margin for rounding
+        band = np.degrees(radius_km / EARTH_RADIUS_KM) * (1 + 1e-9) + 1e-12
+        # Queries sorted by latitude share most of their band with their neighbours
+        query_order = np.argsort(lats, kind="stable")
+        start = 0
+        while start < len(query_order):
+            chunk = query_order[start:start + 64]
+            while True:
+                low, high = np.searchsorted(self.sorted_lats, [lats[chunk].min() - band, lats[chunk].max() + band])
+                if len(chunk) == 1 or len(chunk) * (high - low) <= max_block:
+                    break
+                chunk = chunk[:max(1, max_block // max(high - low, 1))]
+            candidates = self.by_lat[low:high]
+            distances = haversine(lats[chunk, None], lons[chunk, None],
+                                  self.lats[candidates][None, :], self.lons[candidates][None, :])
+            for row, query in enumerate(chunk):
+                hits = np.flatnonzero(distances[row] <= radius_km)
+                hits = hits[np.argsort(distances[row, hits], kind="stable")]
+                results[query] = (candidates[hits], distances[row, hits])
+            start += len(chunk)
+        return results
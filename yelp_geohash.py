@@ -0,0 +1,88 @@
+from math import radians, cos, floor
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells, stored with every business
+MAX_COVER_CELLS = 32   # upper bound on cells used to cover a query area
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _cell_bits(precision):
+    """Return the number of (latitude, longitude) bits of a geohash"""
+    bits = 5 * precision
+    return bits // 2, bits - bits // 2
+
+
+def cell_size(precision):
+    """Return the (height, width) of a geohash cell in degrees"""
+    lat_bits, lon_bits = _cell_bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a latitude/longitude pair as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(chars)
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing a circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    # Widen the longitude span at the edge of the circle closest to a pole
+    edge_lat = min(abs(lat) + dlat, 89.9)
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * cos(radians(edge_lat))), 180.0)
+    return (max(lat - dlat, -90.0), min(lat + dlat, 90.0),
+            lon - dlon, lon + dlon)
+
+
+def _cells_in_box(min_lat, max_lat, min_lon, max_lon, precision):
+    """Enumerate the geohash cells of one precision that intersect a box"""
+    height, width = cell_size(precision)
+    lat_start = floor((min_lat + 90.0) / height)
+    lat_stop = floor((min(max_lat, 90.0 - 1e-9) + 90.0) / height)
+    lon_start = floor((min_lon + 180.0) / width)
+    lon_stop = floor((max_lon + 180.0) / width)
+    lon_cells = 1 << _cell_bits(precision)[1]
+    cells = set()
+    for i in range(lat_start, lat_stop + 1):
+        center_lat = -90.0 + (i + 0.5) * height
+        for j in range(lon_start, lon_stop + 1):
+            # Wrap around the antimeridian
+            center_lon = -180.0 + ((j % lon_cells) + 0.5) * width
+            cells.add(encode(center_lat, center_lon, precision))
+    return cells
+
+
+def covering_cells(lat, lon, radius_km, max_cells=MAX_COVER_CELLS):
+    """Return the finest set of geohash prefixes covering a search circle.
+
+    Every point within ``radius_km`` of (lat, lon) has a geohash starting
+    with one of the returned prefixes, so the prefixes can be used to select
+    candidates from the index before refining the distances exactly.
+    """
+    box = bounding_box(lat, lon, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        estimate = ((box[1] - box[0]) / height + 2) * ((box[3] - box[2]) / width + 2)
+        if estimate > max_cells * 4:
+            continue
+        cells = _cells_in_box(*box, precision)
+        if len(cells) <= max_cells:
+            return sorted(cells)
+    return sorted(BASE32)
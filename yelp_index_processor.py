@@ -1,13 +1,380 @@
+import ast
+import hashlib
+import json
+import math
 import os
+import shutil
+import tempfile
 import time
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from whoosh.index import create_in
-from whoosh.fields import Schema, TEXT, NUMERIC, ID, BOOLEAN, KEYWORD, DATETIME
+from functools import lru_cache
+from itertools import islice
+from whoosh.index import create_in, open_dir, exists_in
+from whoosh.columns import NumericColumn
+from whoosh.fields import Schema, TEXT, NUMERIC, ID, BOOLEAN, KEYWORD, DATETIME, COLUMN
 from whoosh.analysis import StemmingAnalyzer, StopFilter, LowercaseFilter
 from yelp_data_processor import YelpDataProcessor
+from yelp_docstore import TextStoreWriter, has_text_store
+from yelp_geohash import encode as geohash_encode
+from yelp_metrics import metrics
+
+# Only the fields the schemas use are kept when streaming the subset files
+BUSINESS_FIELDS = ('business_id', 'name', 'address', 'city', 'state', 'postal_code', 'latitude', 'longitude',
+                   'stars', 'review_count', 'is_open', 'attributes', 'categories', 'hours')
+REVIEW_FIELDS = ('review_id', 'user_id', 'business_id', 'stars', 'useful', 'funny', 'cool', 'text', 'date')
+REVIEW_NUMERIC_FIELDS = ('stars', 'useful', 'funny', 'cool')
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+class InvalidRecord(ValueError):
+    """Raised for a record whose data cannot be indexed, which is quarantined instead of stopping the run"""
+
+
+def require(item, field, allow_none=True):
+    """Return a required field of a parsed record, raising InvalidRecord if the record lacks it.
+
+    Unless allow_none is set, a null value is rejected as well.
+    """
+    if not isinstance(item, dict):
+        raise InvalidRecord(f"expected a JSON object, got {type(item).__name__}")
+    try:
+        value = item[field]
+    except KeyError:
+        raise InvalidRecord(f"missing field {field!r}") from None
+    if value is None and not allow_none:
+        raise InvalidRecord(f"null field {field!r}")
+    return value
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_review_date(date_str):
+    """Parse a "%Y-%m-%d %H:%M:%S" review date, returning None if it is invalid.
+
+    Dates in the canonical zero-padded layout go through fromisoformat, much
+    faster than strptime; anything else falls back to strptime so the same
+    strings are accepted as before.
+    """
+    if not isinstance(date_str, str):
+        return None
+    if (len(date_str) == 19 and date_str[4] == '-' and date_str[7] == '-' and date_str[10] == ' '
+            and date_str[13] == ':' and date_str[16] == ':'):
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            return None
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _minutes(time_str):
+    hours, minutes = time_str.split(":")
+    minutes = int(hours) * 60 + int(minutes)
+    if not 0 <= minutes <= 24 * 60:
+        raise ValueError(f"time out of range {time_str!r}")
+    return minutes
+
+
+def hour_slots(hours):
+    """Normalize Yelp opening hours such as {"Monday": "7:0-15:0"} into "Monday-07" slot keywords.
+
+    A slot is emitted for every hour the business is open at the start of. A
+    closing time at or before the opening time runs past midnight into the
+    next day, so "0:0-0:0" means open all day. Days whose span cannot be
+    parsed are skipped.
+    """
+    slots = set()
+    for day_index, day in enumerate(DAYS):
+        span = hours.get(day)
+        if not span or not isinstance(span, str):
+            continue
+        try:
+            opening, closing = (_minutes(part) for part in span.split("-"))
+        except ValueError:
+            continue
+        if closing <= opening:
+            closing += 24 * 60
+        for minute in range(-(-opening // 60) * 60, closing, 60):
+            hour = minute // 60
+            slots.add(f"{DAYS[(day_index + hour // 24) % 7]}-{hour % 24:02d}")
+    return ",".join(sorted(slots))
+
+
+def _attribute_value(value):
+    # Attribute values are Python literals serialized as strings, e.g. "u'free'" or "{'garage': False}"
+    try:
+        return ast.literal_eval(value) if isinstance(value, str) else value
+    except (ValueError, SyntaxError):
+        return value
+
+
+def attribute_keywords(attributes):
+    """Normalize Yelp attributes into name=value keywords, flattening nested ones into name.key=value"""
+    keywords = []
+    for name, value in attributes.items():
+        value = _attribute_value(value)
+        if isinstance(value, dict):
+            items = [(f"{name}.{key}", nested) for key, nested in value.items()]
+        else:
+            items = [(name, value)]
+        for keyword, keyword_value in items:
+            if keyword_value is not None:
+                keywords.append(f"{keyword}={keyword_value}".replace(",", " "))
+    return ",".join(keywords)
+
+
+def content_hash(item, fields):
+    """Hash the indexed fields of a record so unchanged records can be skipped"""
+    return hashlib.md5(repr([item.get(field) for field in fields]).encode('utf-8')).hexdigest()
+
+
+def business_document(item):
+    """Build the business index document for a parsed business record"""
+    latitude, longitude = to_float(require(item, 'latitude')), to_float(require(item, 'longitude'))
+    document = dict(
+        business_id=require(item, 'business_id', allow_none=False),
+        name=require(item, 'name'),
+        address=require(item, 'address'),
+        city=require(item, 'city'),
+        state=require(item, 'state'),
+        postal_code=require(item, 'postal_code'),
+        latitude=latitude,
+        longitude=longitude,
+        stars=to_float(require(item, 'stars')),
+        review_count=to_int(require(item, 'review_count')),
+        is_open=require(item, 'is_open'),
+        latitude_column=latitude,
+        longitude_column=longitude,
+        geohash=geohash_encode(latitude, longitude),
+        content_hash=content_hash(item, BUSINESS_FIELDS)
+    )
+    # Missing or malformed values are left out; attributes and hours are indexed as keywords but stored as given
+    if item.get('categories'):
+        document['categories'] = item['categories']
+        document['categories_text'] = item['categories']
+    if item.get('attributes') and isinstance(item['attributes'], dict):
+        document['attributes'] = attribute_keywords(item['attributes'])
+        document['_stored_attributes'] = item['attributes']
+    if item.get('hours') and isinstance(item['hours'], dict):
+        document['hours'] = hour_slots(item['hours'])
+        document['_stored_hours'] = item['hours']
+    return document
+
+
+def without_fields(make_document, fieldnames):
+    """Wrap make_document to leave out fields, e.g. ones an index created with an older schema lacks"""
+    def make_document_without(item):
+        document = make_document(item)
+        for fieldname in fieldnames:
+            document.pop(fieldname, None)
+        return document
+    return make_document_without
+
+
+def to_int(value):
+    """Convert an integral JSON number such as 5.0 to int, raising InvalidRecord for anything else.
+
+    Whoosh would silently truncate a fractional value stored in an integer column.
+    """
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidRecord(f"non-integer value {value!r}") from None
+    if number != value:
+        raise InvalidRecord(f"non-integer value {value!r}")
+    return number
+
+
+def to_float(value):
+    """Convert a finite JSON number to float, raising InvalidRecord for anything else"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise InvalidRecord(f"non-numeric value {value!r}")
+    return float(value)
+
+
+def review_document(item):
+    """Build the review index document for a parsed review record, raising InvalidRecord if it is invalid"""
+    review_date = parse_review_date(require(item, 'date'))
+    if review_date is None:
+        raise InvalidRecord(f"invalid date {item['date']!r}")
+    stars, useful, funny, cool = (to_int(require(item, field)) for field in REVIEW_NUMERIC_FIELDS)
+    return dict(
+        review_id=require(item, 'review_id', allow_none=False),
+        user_id=require(item, 'user_id', allow_none=False),
+        business_id=require(item, 'business_id', allow_none=False),
+        stars=stars,
+        useful=useful,
+        funny=funny,
+        cool=cool,
+        text=require(item, 'text', allow_none=False),
+        date=review_date,
+        content_hash=content_hash(item, REVIEW_FIELDS)
+    )
+
+
+class Quarantine:
+    """Append rejected records and the reason they were rejected to a JSON lines file.
+
+    The file is only created on the first rejection. Without a path the
+    rejected records are just counted.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        self.count = 0
+
+    def add(self, item, reason):
+        self.count += 1
+        if self.path is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps({"reason": reason, "record": item}, default=str) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def add_documents(writer, records, make_document, on_reject=None, on_add=None):
+    """Add records to an index writer, returning the number of documents added.
+
+    Records make_document rejects are passed to on_reject(item, reason), and
+    every document added to on_add(document).
+    Timings are recorded for building the documents, rejected ones included,
+    and for add_document, which includes the field analysis.
+    """
+    prepare_seconds = add_seconds = 0.0
+    count = rejected = 0
+    for item in records:
+        start = time.perf_counter()
+        try:
+            document = make_document(item)
+        except InvalidRecord as e:
+            # Rejected records are timed too, as prepare_document counts them
+            prepare_seconds += time.perf_counter() - start
+            rejected += 1
+            if on_reject is not None:
+                on_reject(item, f"{type(e).__name__}: {e}")
+            continue
+        prepared = time.perf_counter()
+        prepare_seconds += prepared - start
+        writer.add_document(**document)
+        add_seconds += time.perf_counter() - prepared
+        count += 1
+        if on_add is not None:
+            on_add(document)
+    metrics.record("index.prepare_document", prepare_seconds, count=count + rejected)
+    metrics.record("index.add_document", add_seconds, count=count)
+    metrics.incr("index.documents_added", count)
+    metrics.incr("index.documents_rejected", rejected)
+    return count
+
+
+def add_review_documents(writer, reviews, on_reject=None, on_add=None):
+    """Add reviews to an index writer, returning the number of documents added"""
+    return add_documents(writer, reviews, review_document, on_reject, on_add)
+
+
+def commit(writer, stage="index.commit"):
+    with metrics.timer(stage):
+        writer.commit()
+
+
+def load_content_hashes(ix, id_field):
+    """Map every live document id in an index to its content hash, read from the columns"""
+    with ix.reader() as reader:
+        ids = reader.column_reader(id_field)
+        hashes = reader.column_reader("content_hash")
+        return {ids[docnum]: hashes[docnum] for docnum in reader.all_doc_ids()}
+
+
+def upsert_documents(ix, records, id_field, make_document, prune_missing=False, on_reject=None, on_add=None):
+    """Update changed records in an existing index and skip unchanged ones.
+
+    Records are matched to indexed documents by id_field and compared by
+    content hash. If prune_missing is set, the records are treated as a full
+    snapshot and indexed documents whose id does not appear are deleted.
+    """
+    known_hashes = load_content_hashes(ix, id_field)
+    seen = set()
+    added = updated = unchanged = deleted = 0
+    writer = ix.writer()
+    try:
+        for item in records:
+            # A rejected record still counts as present, so pruning keeps its last valid document
+            if isinstance(item, dict):
+                seen.add(item.get(id_field))
+            try:
+                document = make_document(item)
+            except InvalidRecord as e:
+                if on_reject is not None:
+                    on_reject(item, f"{type(e).__name__}: {e}")
+                continue
+            doc_id = document[id_field]
+            seen.add(doc_id)
+            old_hash = known_hashes.get(doc_id)
+            if old_hash == document['content_hash']:
+                unchanged += 1
+                continue
+            with metrics.timer("index.update_document"):
+                writer.update_document(**document)
+            if on_add is not None:
+                on_add(document)
+            if old_hash is None:
+                added += 1
+            else:
+                updated += 1
+        if prune_missing:
+            for doc_id in known_hashes.keys() - seen:
+                deleted += writer.delete_by_term(id_field, doc_id)
+    except BaseException:
+        writer.cancel()
+        raise
+    commit(writer)
+    metrics.incr("index.documents_unchanged", unchanged)
+    metrics.incr("index.documents_deleted", deleted)
+    return {"added": added, "updated": updated, "unchanged": unchanged, "deleted": deleted}
+
+
+def init_index_worker():
+    """Worker initializer: forked workers inherit the parent's metrics, start empty so they are not merged twice"""
+    metrics.reset()
+
+
+def index_review_batch(schema, segment_dir, reviews, limitmb):
+    """Worker task: analyze a batch of reviews into its own temporary index.
+
+    The positions of rejected reviews in the batch are returned to the parent,
+    which owns the quarantine file and, in compact mode, the text store.
+    """
+    start_time = time.time()
+    ix = create_in(segment_dir, schema, indexname="review_index")
+    writer = ix.writer(limitmb=limitmb)
+    positions = {id(item): position for position, item in enumerate(reviews)}
+    rejected = []
+    count = add_review_documents(writer, reviews,
+                                 lambda item, reason: rejected.append((positions[id(item)], reason)))
+    commit(writer)
+    return os.getpid(), count, time.time() - start_time, metrics.drain(), rejected
+
 
 class YelpIndexProcessor:
-    def __init__(self, index_dir_business, index_dir_review, business_subset_path, review_subset_path):
+    def __init__(self, index_dir_business, index_dir_review, business_subset_path, review_subset_path,
+                 incremental=False, quarantine_path=None, compact=False):
+        self.incremental = incremental
+        # Compact storage keeps only IDs and the fields queries return in the index, and moves the review
+        # text to a compressed text store next to the review index (see yelp_docstore)
+        stored = not compact
+        # Rejected records are appended to this JSON lines file instead of stopping or flooding the output
+        self.quarantine_path = quarantine_path
         self.index_dir_business = index_dir_business
         self.index_dir_review = index_dir_review
         self.custom_stopwords = frozenset(["the", "of", "to", "and", "a", "in", "is", "it", "you", "that",
@@ -16,7 +383,7 @@ class YelpIndexProcessor:
         
         # Define schema for business data
         self.schema_business = Schema(
-            business_id=ID(stored=True, unique=True),
+            business_id=ID(stored=True, unique=True, sortable=True),
             name=TEXT(stored=True),
             address=TEXT(stored=True),
             city=TEXT(stored=True),
@@ -24,25 +391,32 @@ class YelpIndexProcessor:
             postal_code=ID(stored=True),
             latitude=NUMERIC(stored=True),
             longitude=NUMERIC(stored=True),
-            stars=NUMERIC(stored=True),
+            stars=NUMERIC(float, stored=True),  # Half stars, filtered with min_stars
             review_count=NUMERIC(stored=True),
             is_open=BOOLEAN(stored=True),
-            attributes=TEXT(stored=True),
-            categories=KEYWORD(stored=True, commas=True),
-            hours=TEXT(stored=True)
+            attributes=KEYWORD(stored=stored, commas=True),  # "WiFi=free" keywords
+            categories=KEYWORD(stored=stored, commas=True, sortable=True),  # Facet counted by YelpSearcher
+            categories_text=TEXT(),  # Lowercased category words for free text search, the facet keeps the case
+            hours=KEYWORD(stored=stored, commas=True),  # "Friday-20" slots the business is open at
+            geohash=ID(),  # Spatial index used by GeoSearch, searched but not returned with hits
+            # Exact coordinates by docnum for the geo kernels, neither stored nor searchable
+            latitude_column=COLUMN(NumericColumn("d", default=math.nan)),
+            longitude_column=COLUMN(NumericColumn("d", default=math.nan)),
+            content_hash=ID(sortable=True)  # Change detection for incremental updates, read from the column
         )
 
         # Define schema for review data
         self.schema_review = Schema(
-            review_id=ID(stored=True, unique=True),
-            user_id=ID(stored=True),
-            business_id=ID(stored=True),
-            stars=NUMERIC(stored=True),
-            useful=NUMERIC(stored=True),
-            funny=NUMERIC(stored=True),
-            cool=NUMERIC(stored=True),
-            text=TEXT(stored=True, analyzer=self.custom_analyzer),
-            date=DATETIME(stored=True)
+            review_id=ID(stored=True, unique=True, sortable=True),
+            user_id=ID(stored=True, sortable=True),
+            business_id=ID(stored=True, sortable=True),
+            stars=NUMERIC(stored=True, sortable=True),
+            useful=NUMERIC(stored=stored),
+            funny=NUMERIC(stored=stored),
+            cool=NUMERIC(stored=stored),
+            text=TEXT(stored=stored, analyzer=self.custom_analyzer),
+            date=DATETIME(stored=True),
+            content_hash=ID(sortable=True)  # Change detection for incremental updates, read from the column
         )
 
         # Ensure index directories exist
@@ -51,75 +425,240 @@ class YelpIndexProcessor:
         if not os.path.exists(self.index_dir_review):
             os.mkdir(self.index_dir_review)
 
-        # Create indices for business and review data
-        self.business_ix = create_in(self.index_dir_business, self.schema_business, indexname="business_index")
-        self.review_ix = create_in(self.index_dir_review, self.schema_review, indexname="review_index")
+        # Create indices for business and review data, or reopen them for incremental updates
+        self.business_ix = self._open_or_create(self.index_dir_business, self.schema_business, "business_index")
+        # A reopened business index created before the coordinate columns or category text is updated without them
+        self._business_document = business_document
+        missing = [fieldname for fieldname in ("latitude_column", "longitude_column", "categories_text")
+                   if fieldname not in self.business_ix.schema]
+        if missing:
+            self._business_document = without_fields(business_document, missing)
+        self.review_ix = self._open_or_create(self.index_dir_review, self.schema_review, "review_index")
+        # A reopened index keeps the storage mode it was created with
+        self.compact = not self.review_ix.schema["text"].stored
+        if self.compact and not (self.incremental and has_text_store(self.index_dir_review)):
+            TextStoreWriter(self.index_dir_review, create=True).close()
 
         # Initialize data processor
         self.data_processor = YelpDataProcessor(business_subset_path, review_subset_path)
 
+    def _open_or_create(self, index_dir, schema, indexname):
+        if self.incremental and exists_in(index_dir, indexname=indexname):
+            return open_dir(index_dir, indexname=indexname)
+        return create_in(index_dir, schema, indexname=indexname)
+
     def index_business_data(self):
         """Index business data"""
         start_time = time.time()
-        writer = self.business_ix.writer()
-        business_data = self.data_processor.get_business_data()
-        for item in business_data:
-            writer.add_document(
-                business_id=item['business_id'],
-                name=item['name'],
-                address=item['address'],
-                city=item['city'],
-                state=item['state'],
-                postal_code=item['postal_code'],
-                latitude=item['latitude'],
-                longitude=item['longitude'],
-                stars=item['stars'],
-                review_count=item['review_count'],
-                is_open=item['is_open']
-            )
-        writer.commit()
+        quarantine = Quarantine(self.quarantine_path)
+        try:
+            writer = self.business_ix.writer()
+            try:
+                add_documents(writer, self.data_processor.iter_business_data(BUSINESS_FIELDS), self._business_document,
+                              quarantine.add)
+            except BaseException:
+                writer.cancel()
+                raise
+            commit(writer)
+        finally:
+            quarantine.close()
         index_time = time.time() - start_time
         print("Business data indexed successfully!")
         print(f"Indexing time: {index_time:.2f} seconds")
+        self._report_rejected(quarantine)
 
-    def parse_review_date(self, date_str):
+    def update_business_data(self, prune_missing=False):
+        """Upsert changed businesses into the existing index by business_id"""
+        start_time = time.time()
+        quarantine = Quarantine(self.quarantine_path)
         try:
-            return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            print(f"Invalid date format: {date_str}")
-            return None
+            stats = upsert_documents(self.business_ix, self.data_processor.iter_business_data(BUSINESS_FIELDS),
+                                     "business_id", self._business_document, prune_missing=prune_missing,
+                                     on_reject=quarantine.add)
+        finally:
+            quarantine.close()
+        index_time = time.time() - start_time
+        self._report_rejected(quarantine)
+        print(f"Business data updated: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['deleted']} deleted")
+        print(f"Indexing time: {index_time:.2f} seconds")
+        return stats
+
+    def update_review_data(self, since=None, prune_missing=False):
+        """Upsert changed reviews into the existing index by review_id.
+
+        If since is given (a "YYYY-MM-DD HH:MM:SS" high-water mark), older
+        reviews are skipped without hashing them. It cannot be combined with
+        prune_missing, which needs to see every review.
+        """
+        if since and prune_missing:
+            raise ValueError("since and prune_missing cannot be combined")
+        start_time = time.time()
+        reviews = self.data_processor.iter_review_data(REVIEW_FIELDS)
+        if since:
+            # Records without a usable date are kept so review_document rejects them into the quarantine
+            reviews = (item for item in reviews
+                       if not isinstance(item, dict) or not isinstance(item.get('date'), str) or item['date'] >= since)
+        quarantine = Quarantine(self.quarantine_path)
+        try:
+            with self._review_texts() as on_add:
+                stats = upsert_documents(self.review_ix, reviews, "review_id", review_document,
+                                         prune_missing=prune_missing, on_reject=quarantine.add, on_add=on_add)
+        finally:
+            quarantine.close()
+        index_time = time.time() - start_time
+        self._report_rejected(quarantine)
+        print(f"Review data updated: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['deleted']} deleted")
+        print(f"Indexing time: {index_time:.2f} seconds")
+        return stats
+
+    def delete_businesses(self, business_ids):
+        """Delete businesses from the index by business_id"""
+        return self._delete_documents(self.business_ix, "business_id", business_ids)
+
+    def delete_reviews(self, review_ids):
+        """Delete reviews from the index by review_id"""
+        return self._delete_documents(self.review_ix, "review_id", review_ids)
+
+    def _delete_documents(self, ix, id_field, doc_ids):
+        writer = ix.writer()
+        deleted = 0
+        for doc_id in doc_ids:
+            deleted += writer.delete_by_term(id_field, doc_id)
+        commit(writer)
+        metrics.incr("index.documents_deleted", deleted)
+        return deleted
+
+    def parse_review_date(self, date_str):
+        return parse_review_date(date_str)
+
+    @contextmanager
+    def _review_texts(self):
+        """Yield an on_add callback writing review texts to the text store in compact mode, else None"""
+        if not self.compact:
+            yield None
+            return
+        with TextStoreWriter(self.index_dir_review) as text_writer:
+            yield lambda document: text_writer.add(document['review_id'], document['text'])
+
+    def _report_rejected(self, quarantine):
+        if quarantine.count:
+            target = f" (see {quarantine.path})" if quarantine.path else ""
+            print(f"Rejected {quarantine.count} invalid records{target}")
 
     def index_review_data_chunks(self, num_batch):
         """Index review data in chunks"""
-        review_data = self.data_processor.get_review_data()
-        batch_size = len(review_data) // num_batch
+        review_count = self.data_processor.count_reviews()
+        batch_size = max(review_count // num_batch, 1)
         print('batch size:', batch_size)
-        review_chunks = [review_data[i:i+batch_size] for i in range(0, 9*batch_size, batch_size)] + [review_data[9*batch_size:]]
-        print('num batch', len(review_chunks))
+        print('num batch', num_batch)
+        review_data = self.data_processor.iter_review_data(REVIEW_FIELDS)
+        quarantine = Quarantine(self.quarantine_path)
 
         chunk_time = []
-        for index, chunk in enumerate(review_chunks):
-            start_time = time.time()
-            writer = self.review_ix.writer()
-
-            for item in chunk:
-                review_date = self.parse_review_date(item['date'])
-                if review_date:
-                    writer.add_document(
-                        review_id=item['review_id'],
-                        user_id=item['user_id'],
-                        business_id=item['business_id'],
-                        stars=item['stars'],
-                        useful=item['useful'],
-                        funny=item['funny'],
-                        cool=item['cool'],
-                        text=item['text'],
-                        date=review_date
-                    )
-            writer.commit()
-            index_time = time.time() - start_time
-            chunk_time.append(index_time)
-            print(f"Review data batch_{index} indexed successfully!")
-            print(f"Indexing time: {index_time:.2f} seconds")
-
-        return chunk_time
\ No newline at end of file
+        total_docs = 0
+        try:
+            with self._review_texts() as on_add:
+                for index in range(num_batch):
+                    start_time = time.time()
+                    writer = self.review_ix.writer()
+
+                    # The last chunk takes all remaining reviews
+                    chunk = islice(review_data, batch_size if index < num_batch - 1 else None)
+                    count = add_review_documents(writer, chunk, quarantine.add, on_add)
+                    commit(writer)
+                    index_time = time.time() - start_time
+                    chunk_time.append(index_time)
+                    total_docs += count
+                    print(f"Review data batch_{index} indexed successfully!")
+                    rate = count / index_time if index_time else 0.0
+                    print(f"Indexing time: {index_time:.2f} seconds ({rate:.0f} reviews/s)")
+        finally:
+            quarantine.close()
+
+        total_time = sum(chunk_time)
+        print(f"Review data indexed: {total_docs} reviews in {total_time:.2f} seconds "
+              f"({total_docs / total_time if total_time else 0.0:.0f} reviews/s)")
+        self._report_rejected(quarantine)
+        return chunk_time
+
+    def index_review_data_parallel(self, num_workers=None, batch_size=10000, limitmb=128):
+        """Index review data with a process pool, merging the worker segments at the end.
+
+        Each task analyzes one batch of reviews into a temporary index using at
+        most limitmb of memory for its writer. The temporary segments are then
+        merged into the review index with a single commit.
+        """
+        start_time = time.time()
+        segment_dirs = []
+        max_pending = 2 * (num_workers or os.cpu_count() or 1)
+
+        worker_docs = defaultdict(int)
+        worker_time = defaultdict(float)
+
+        quarantine = Quarantine(self.quarantine_path)
+
+        batches = {}  # Pending future -> its batch, kept to quarantine or store the texts once it is validated
+
+        def collect(futures, on_add):
+            for future in futures:
+                pid, count, elapsed, worker_metrics, rejected = future.result()
+                metrics.merge(worker_metrics)
+                rejected = dict(rejected)
+                for position, item in enumerate(batches.pop(future)):
+                    if position in rejected:
+                        quarantine.add(item, rejected[position])
+                    elif on_add is not None:
+                        # In compact mode the parent writes the texts of the reviews the worker accepted
+                        on_add(item)
+                worker_docs[pid] += count
+                worker_time[pid] += elapsed
+
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=init_index_worker) as executor, \
+                    self._review_texts() as on_add:
+                pending = set()
+                for batch in self.data_processor.iter_review_batches(batch_size, REVIEW_FIELDS):
+                    # Bound the number of batches in flight so memory stays flat
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done, on_add)
+                    segment_dir = tempfile.mkdtemp(prefix="_segment_", dir=self.index_dir_review)
+                    segment_dirs.append(segment_dir)
+                    future = executor.submit(index_review_batch, self.review_ix.schema, segment_dir, batch, limitmb)
+                    batches[future] = batch
+                    pending.add(future)
+                collect(wait(pending).done, on_add)
+            analysis_time = time.time() - start_time
+
+            merge_start = time.time()
+            writer = self.review_ix.writer(limitmb=limitmb)
+            for segment_dir in segment_dirs:
+                with open_dir(segment_dir, indexname="review_index").reader() as reader:
+                    writer.add_reader(reader)
+            commit(writer, stage="index.merge_commit")
+            merge_time = time.time() - merge_start
+        finally:
+            quarantine.close()
+            for segment_dir in segment_dirs:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+
+        total_time = time.time() - start_time
+        total_docs = sum(worker_docs.values())
+        for pid in sorted(worker_docs):
+            rate = worker_docs[pid] / worker_time[pid] if worker_time[pid] else 0.0
+            print(f"Worker {pid}: {worker_docs[pid]} reviews in {worker_time[pid]:.2f} seconds ({rate:.0f} reviews/s)")
+        print(f"Analysis time: {analysis_time:.2f} seconds, merge time: {merge_time:.2f} seconds")
+        print(f"Review data indexed successfully! {total_docs} reviews in {total_time:.2f} seconds "
+              f"({total_docs / total_time if total_time else 0.0:.0f} reviews/s)")
+        self._report_rejected(quarantine)
+
+        return {
+            "workers": {pid: {"reviews": worker_docs[pid], "seconds": worker_time[pid]} for pid in worker_docs},
+            "reviews": total_docs,
+            "rejected": quarantine.count,
+            "analysis_time": analysis_time,
+            "merge_time": merge_time,
+            "total_time": total_time,
+        }
@@ -0,0 +1,73 @@
+import numpy as np
+from whoosh.fields import NUMERIC
+from whoosh.index import open_dir
+
+
+class YelpIndexAggregator:
+    """Group-by statistics computed from index columns and term frequencies.
+
+    Values are read from a field's column (fields declared sortable) or,
+    failing that, from the document frequencies of the field's terms, so
+    stored documents are never deserialized.
+    """
+
+    def __init__(self, index_dir, indexname):
+        self.index_dir = index_dir
+        self.ix = open_dir(index_dir, indexname=indexname)
+
+    def column_values(self, fieldname):
+        """Return the column values of a field for every live document as a NumPy array"""
+        with self.ix.reader() as reader:
+            return self._column_values(reader, fieldname)
+
+    def _column_values(self, reader, fieldname):
+        if not reader.has_column(fieldname):
+            raise ValueError(f"Field {fieldname!r} has no column, declare it sortable=True")
+        column = reader.column_reader(fieldname)
+        field = self.ix.schema[fieldname]
+        if isinstance(field, NUMERIC):
+            # Numbers go straight into a typed array, without a Python list of one object per document
+            dtype = np.float64 if field.numtype is float else np.int64
+            values = np.fromiter(column, dtype=dtype, count=reader.doc_count_all())
+        else:
+            values = np.array(list(column))
+        if reader.has_deletions():
+            values = values[np.fromiter(reader.all_doc_ids(), dtype=np.int64)]
+        return values
+
+    def group_counts(self, fieldname):
+        """Return (values, counts) arrays with the number of documents per distinct field value"""
+        with self.ix.reader() as reader:
+            if reader.has_column(fieldname):
+                return np.unique(self._column_values(reader, fieldname), return_counts=True)
+
+            # Fall back to the term document frequencies of the field. sortable_terms leaves out the
+            # lower-precision terms NUMERIC fields index for range queries, which would inflate the counts
+            field = self.ix.schema[fieldname]
+            values, counts = [], []
+            for term in field.sortable_terms(reader, fieldname):
+                if reader.has_deletions():
+                    count = sum(1 for docnum in reader.postings(fieldname, term).all_ids()
+                                if not reader.is_deleted(docnum))
+                else:
+                    count = reader.doc_frequency(fieldname, term)
+                if count:
+                    values.append(field.from_bytes(term))
+                    counts.append(count)
+            return np.array(values), np.array(counts, dtype=np.int64)
+
+    def count_distribution(self, fieldname):
+        """Return (group_size, num_groups) arrays, e.g. how many users wrote n reviews for each n"""
+        _, counts = self.group_counts(fieldname)
+        histogram = np.bincount(counts)
+        sizes = np.nonzero(histogram)[0]
+        return sizes, histogram[sizes]
+
+    def reviews_per_user(self):
+        return self.group_counts("user_id")
+
+    def reviews_per_business(self):
+        return self.group_counts("business_id")
+
+    def star_distribution(self):
+        return self.group_counts("stars")
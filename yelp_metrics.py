@@ -0,0 +1,150 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Process-wide registry of per-stage timers and counters.
+
+    Timers accumulate a call count, total and maximum seconds per stage.
+    Stages recorded a batch at a time only know the duration of the whole
+    batch, which is tracked separately as the maximum batch seconds.
+    Worker processes send their drain() snapshot back to the parent, which
+    merges it, so one registry covers a whole multi-process run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}  # name -> [count, total_seconds, max_seconds, max_batch_seconds]
+        self.counters = Counter()
+
+    def record(self, name, seconds, count=1):
+        """Add seconds spent in count calls of a stage, e.g. a whole batch timed at once"""
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0, 0.0])
+            timer[0] += count
+            timer[1] += seconds
+            if count == 1:
+                timer[2] = max(timer[2], seconds)
+            else:
+                timer[3] = max(timer[3], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _snapshot(self):
+        return {
+            "timers": {name: {"count": count, "total_seconds": total, "max_seconds": longest,
+                              "max_batch_seconds": longest_batch}
+                       for name, (count, total, longest, longest_batch) in self.timers.items()},
+            "counters": dict(self.counters),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return self._snapshot()
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def drain(self):
+        """Return a snapshot and reset, e.g. to ship a worker's metrics to the parent process"""
+        with self._lock:
+            snapshot = self._snapshot()
+            self.timers.clear()
+            self.counters.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, timer in snapshot["timers"].items():
+                current = self.timers.setdefault(name, [0, 0.0, 0.0, 0.0])
+                current[0] += timer["count"]
+                current[1] += timer["total_seconds"]
+                current[2] = max(current[2], timer["max_seconds"])
+                current[3] = max(current[3], timer["max_batch_seconds"])
+            self.counters.update(snapshot["counters"])
+
+    def to_prometheus(self, prefix="yelp"):
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            f"# TYPE {prefix}_stage_calls_total counter",
+            f"# TYPE {prefix}_stage_max_seconds gauge",
+            f"# TYPE {prefix}_stage_max_batch_seconds gauge",
+        ]
+        for name, timer in sorted(snapshot["timers"].items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {timer["total_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {timer["count"]}')
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{name}"}} {timer["max_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_max_batch_seconds{{stage="{name}"}} {timer["max_batch_seconds"]:.6f}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self):
+        """Render one structured log record per timer and counter"""
+        snapshot = self.snapshot()
+        records = [dict(type="timer", name=name, **timer) for name, timer in sorted(snapshot["timers"].items())]
+        records += [dict(type="counter", name=name, value=value)
+                    for name, value in sorted(snapshot["counters"].items())]
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def write(self, path):
+        """Write the metrics to path: Prometheus text for .prom/.txt files, JSON lines otherwise"""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json_lines()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profiling(profile_path=None, trace_memory=False, top=20):
+    """Optionally capture a cProfile dump and a tracemalloc allocation report around a block.
+
+    Only the current process is profiled, not pool workers.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+            print(report.getvalue())
+            print(f"Profile saved to {profile_path}")
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Traced memory: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB")
+            print(f"Top {top} allocation sites:")
+            for stat in snapshot.statistics("lineno")[:top]:
+                print(f"  {stat}")
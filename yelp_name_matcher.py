@@ -0,0 +1,80 @@
+from collections import deque
+
+
+def _fold(text):
+    """Lowercase text while keeping every character at the same offset"""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    # A few characters expand when lowercased; leave those untouched
+    return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class BusinessNameMatcher:
+    """Aho-Corasick automaton finding every business name mentioned in a text.
+
+    The automaton is built once from a name -> business_id mapping and then
+    finds all case-insensitive, whole-word mentions in a single linear pass
+    over the text, whatever the number of names.
+    """
+
+    def __init__(self, business_name_to_id):
+        self.names = []
+        self.business_ids = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for name, business_id in business_name_to_id.items():
+            if name:
+                self._add(name, business_id)
+        self._build_failure_links()
+
+    def _add(self, name, business_id):
+        state = 0
+        for ch in _fold(name):
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(len(self.names))
+        self.names.append(name)
+        self.business_ids.append(business_id)
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(ch, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """Yield (start, end, business_name, business_id) for every whole-word mention in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, ch in enumerate(_fold(text)):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern in output[state]:
+                name = self.names[pattern]
+                start, end = i + 1 - len(name), i + 1
+                # Same semantics as a regex \b on both sides of the name
+                before = _is_word_char(text[start - 1]) if start > 0 else False
+                after = _is_word_char(text[end]) if end < len(text) else False
+                if before != _is_word_char(name[0]) and after != _is_word_char(name[-1]):
+                    yield start, end, name, self.business_ids[pattern]
@@ -0,0 +1,59 @@
+import threading
+from functools import lru_cache
+
+# NLTK data packages and where nltk.data.find looks for them
+RESOURCE_PATHS = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "stopwords": "corpora/stopwords",
+}
+
+_ready = set()
+_lock = threading.Lock()
+
+
+def ensure_nltk_data(name):
+    """Make an NLTK data package available, once per process.
+
+    The offline nltk.data.find lookup runs first, so the downloader (and its
+    network check) is only used when the package is actually missing. Raises
+    LookupError naming the package if it cannot be downloaded.
+    """
+    if name in _ready:
+        return
+    with _lock:
+        if name in _ready:
+            return
+        import nltk
+        try:
+            nltk.data.find(RESOURCE_PATHS[name])
+        except LookupError:
+            nltk.download(name, quiet=True)
+            try:
+                nltk.data.find(RESOURCE_PATHS[name])
+            except LookupError:
+                raise LookupError(f"NLTK data package {name!r} is missing and could not be downloaded; "
+                                  f"install it with: python -m nltk.downloader {name}") from None
+        _ready.add(name)
+
+
+@lru_cache(maxsize=None)
+def sentence_tokenizer():
+    """Return NLTK's sent_tokenize once its data is available, e.g. to check for the data up front"""
+    from nltk.tokenize import punkt, sent_tokenize
+    # NLTK 3.8.2 and later load the Punkt parameters from punkt_tab instead of the pickled punkt models
+    ensure_nltk_data("punkt_tab" if hasattr(punkt, "PunktTokenizer") else "punkt")
+    return sent_tokenize
+
+
+def sent_tokenize(text):
+    """Split text into sentences with NLTK, importing it and checking its data on first use"""
+    return sentence_tokenizer()(text)
+
+
+@lru_cache(maxsize=None)
+def english_stopwords():
+    """Return NLTK's English stop words, importing NLTK and checking its data on first use"""
+    ensure_nltk_data("stopwords")
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
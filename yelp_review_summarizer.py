@@ -1,102 +1,93 @@
 from whoosh.index import open_dir
 from whoosh.qparser import QueryParser
-from collections import Counter, defaultdict
-from nltk.tokenize import sent_tokenize
-from nltk.corpus import stopwords
-import nltk
-import matplotlib.pyplot as plt
-
-nltk.download('punkt')
-nltk.download('stopwords')
+from yelp_docstore import attach_texts, open_text_store
+from yelp_searcher import GeoSearch
+from yelp_user_profiles import YelpUserProfileStore, build_user_profile, in_review_order
+from yelp_metrics import metrics
+from yelp_nltk import english_stopwords
 
 class YelpReviewSummarizer:
-    def __init__(self, index_dir_review, index_dir_business):
+    def __init__(self, index_dir_review, index_dir_business, profile_store_path=None, review_pool=None,
+                 business_pool=None):
         self.index_dir_review = index_dir_review
         self.index_dir_business = index_dir_business
-        self.stop_words = set(stopwords.words('english'))
+        # Optional SearcherPools sharing open indexes and searchers across requests
+        self.review_pool = review_pool
+        review_ix = review_pool.ix if review_pool else open_dir(index_dir_review, indexname="review_index")
+        # Review text lives in a separate store when the index was built in compact mode
+        self.text_store = open_text_store(review_ix, index_dir_review)
+        self.geo_searcher = GeoSearch(index_dir_business, pool=business_pool)
+        self.profile_store = None
+        if profile_store_path:
+            self.profile_store = YelpUserProfileStore(profile_store_path, index_dir_review, index_dir_business)
+
+    def update_profile_store(self):
+        """Bring the profile store up to date with the review index"""
+        return self.profile_store.update()
 
     def plot_review_distribution(self):
-        ix_review = open_dir(self.index_dir_review, indexname="review_index")
-        
-        with ix_review.searcher() as searcher:
-            # Get all user IDs and their review counts
-            user_review_counts = defaultdict(int)
-            for doc in searcher.documents():
-                user_review_counts[doc['user_id']] += 1
-            
-            # Calculate the number of users for each review count
-            review_count_distribution = defaultdict(int)
-            for count in user_review_counts.values():
-                review_count_distribution[count] += 1
-            
-            # Prepare plotting data
-            x = list(review_count_distribution.keys())
-            y = list(review_count_distribution.values())
+        # matplotlib and NumPy are only loaded by runs that plot
+        import matplotlib.pyplot as plt
+        from yelp_index_stats import YelpIndexAggregator
+
+        # Count reviews per user from the user_id column, without loading stored documents
+        aggregator = YelpIndexAggregator(self.index_dir_review, "review_index")
+        x, y = aggregator.count_distribution("user_id")
+        review_count_distribution = dict(zip(x.tolist(), y.tolist()))
 
-            # Plot the chart
-            plt.figure(figsize=(12, 6))
-            plt.scatter(x, y, alpha=0.5)
-            plt.xlabel('Number of reviews contributed by a user')
-            plt.ylabel('Number of users')
-            plt.title('Distribution of reviews contributed by users')
-            plt.xscale('symlog', linthresh=1)
-            plt.yscale('symlog', linthresh=1)
-            plt.grid(True)
-            
-            # Add annotations for specific points
-            for point in [10, 20, 30, 50, 100]:
-                if point in review_count_distribution:
-                    plt.annotate(f'({point}, {review_count_distribution[point]})', 
-                                 (point, review_count_distribution[point]),
-                                 xytext=(5, 5), textcoords='offset points')
-            
-            plt.savefig('review_distribution.png')
-            print("Review distribution plot saved as 'review_distribution.png'")
+        # Plot the chart
+        plt.figure(figsize=(12, 6))
+        plt.scatter(x, y, alpha=0.5)
+        plt.xlabel('Number of reviews contributed by a user')
+        plt.ylabel('Number of users')
+        plt.title('Distribution of reviews contributed by users')
+        plt.xscale('symlog', linthresh=1)
+        plt.yscale('symlog', linthresh=1)
+        plt.grid(True)
+        
+        # Add annotations for specific points
+        for point in [10, 20, 30, 50, 100]:
+            if point in review_count_distribution:
+                plt.annotate(f'({point}, {review_count_distribution[point]})', 
+                             (point, review_count_distribution[point]),
+                             xytext=(5, 5), textcoords='offset points')
+        
+        plt.savefig('review_distribution.png')
+        print("Review distribution plot saved as 'review_distribution.png'")
 
     def get_user_review_summary(self, user_id):
-        ix_review = open_dir(self.index_dir_review, indexname="review_index")
-        ix_business = open_dir(self.index_dir_business, indexname="business_index")
+        # Read the precomputed profile when a profile store is configured
+        if self.profile_store is not None:
+            with metrics.timer("summary.profile_store"):
+                summary = self.profile_store.get_summary(user_id)
+            if summary is not None:
+                metrics.incr("summary.profile_store_hits")
+                return summary
+            metrics.incr("summary.profile_store_misses")
 
-        with ix_review.searcher() as searcher_review, ix_business.searcher() as searcher_business:
-            # Get user review count
-            user_query = QueryParser("user_id", ix_review.schema).parse(user_id)
-            results = searcher_review.search(user_query, limit=None)
-            review_count = len(results)
+        if self.review_pool:
+            searcher_context = self.review_pool.searcher()
+        else:
+            searcher_context = open_dir(self.index_dir_review, indexname="review_index").searcher()
 
-            # Get user activity area
-            business_ids = set(result['business_id'] for result in results)
-            min_lat, max_lat, min_lon, max_lon = float('inf'), float('-inf'), float('inf'), float('-inf')
-            for business_id in business_ids:
-                business_query = QueryParser("business_id", ix_business.schema).parse(business_id)
-                business_results = searcher_business.search(business_query)
-                if business_results:
-                    business = business_results[0]
-                    min_lat = min(min_lat, business['latitude'])
-                    max_lat = max(max_lat, business['latitude'])
-                    min_lon = min(min_lon, business['longitude'])
-                    max_lon = max(max_lon, business['longitude'])
+        with searcher_context as searcher_review:
+            # Get user reviews
+            with metrics.timer("summary.search"):
+                user_query = QueryParser("user_id", searcher_review.schema).parse(user_id)
+                results = searcher_review.search(user_query, limit=None)
+                reviews = in_review_order(attach_texts(self.text_store, [result.fields() for result in results]))
 
-            # Get frequent words and phrases
-            all_words = []
-            all_text = ""
-            for result in results:
-                words = [word.lower() for word in result['text'].split() if word.lower() not in self.stop_words]
-                all_words.extend(words)
-                all_text += result['text'] + " "
+            # Get user activity area
+            with metrics.timer("summary.locations"):
+                business_ids = set(review['business_id'] for review in reviews)
+                locations = self.geo_searcher.business_locations(business_ids).values()
 
-            top_words = Counter(all_words).most_common(10)
-            
-            # Get representative sentences (simple method: choose sentences containing the most frequent words)
-            sentences = sent_tokenize(all_text)
-            sentence_scores = [(sentence, sum(word in sentence.lower() for word, _ in top_words)) for sentence in sentences]
-            representative_sentences = sorted(sentence_scores, key=lambda x: x[1], reverse=True)[:3]
+            with metrics.timer("summary.profile"):
+                # The stop words are loaded, and NLTK imported, by the first summary
+                profile = build_user_profile([review['text'] for review in reviews], locations, english_stopwords())
 
-        return {
-            "review_count": review_count,
-            "bounding_box": (min_lat, max_lat, min_lon, max_lon),
-            "top_words": top_words,
-            "representative_sentences": [sentence for sentence, _ in representative_sentences]
-        }
+        del profile["word_counts"]
+        return profile
 
     def print_user_review_summary(self, user_id):
         summary = self.get_user_review_summary(user_id)
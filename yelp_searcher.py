@@ -1,38 +1,98 @@
 from whoosh.index import open_dir
 from whoosh.qparser import QueryParser, MultifieldParser
-from whoosh import scoring, index
-from math import radians, cos, sin, sqrt, atan2
+from whoosh import scoring, index, query, sorting
+import heapq
+from math import radians, cos, sin, sqrt, atan2, exp
+from yelp_docstore import attach_texts, open_text_store
+from yelp_geohash import covering_cells
+from yelp_metrics import metrics
+
+def has_coordinate_columns(reader):
+    """Whether a business index has the exact coordinate columns, missing from indexes built before them"""
+    return all(fieldname in reader.schema and reader.has_column(fieldname)
+               for fieldname in ("latitude_column", "longitude_column"))
+
+
+def business_filter(category=None, min_stars=None, is_open=None, open_at=None, attributes=None):
+    """Build an index filter for business searches, or None if no condition is given.
+
+    open_at is an hour slot such as "Friday-20" and attributes are keywords
+    such as "WiFi=free", as normalized by the indexer.
+    """
+    conditions = []
+    if category:
+        conditions.append(query.Term("categories", category))
+    if min_stars is not None:
+        conditions.append(query.NumericRange("stars", min_stars, None))
+    if is_open is not None:
+        conditions.append(query.Term("is_open", bool(is_open)))
+    if open_at:
+        conditions.append(query.Term("hours", open_at))
+    for attribute in attributes or ():
+        conditions.append(query.Term("attributes", attribute))
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else query.And(conditions)
 
 class YelpSearcher:
-    def __init__(self, index_dir, indexname):
+    def __init__(self, index_dir, indexname, pool=None):
         self.index_dir = index_dir
-        self.ix = open_dir(self.index_dir, indexname=indexname)
+        # A SearcherPool shares one index and reusable searchers across requests
+        self.pool = pool
+        self.ix = pool.ix if pool else open_dir(self.index_dir, indexname=indexname)
+        # Review text lives in a separate store when the index was built in compact mode
+        self.text_store = open_text_store(self.ix, index_dir)
 
-    def search_business(self, query_str):
-        """Search for businesses by name"""
-        with self.ix.searcher() as searcher:
-            query = QueryParser("name", self.ix.schema).parse(query_str)
-            results = searcher.search(query)
+    def _searcher(self):
+        return self.pool.searcher() if self.pool else self.ix.searcher()
 
-            print(f"Found {len(results)} results for business name search:")
-            for result in results:
-                print(f"Business: {result['name']}, City: {result['city']}, State: {result['state']}")
+    def search_business(self, query_str, top_n=10, category=None, min_stars=None, is_open=None, open_at=None,
+                        attributes=None, facets=()):
+        """Search for businesses by name, returning the total hit count, the top_n hits and facet counts.
 
-    def search_review(self, query_str, top_n):
-        """Search for reviews by content"""
-        with self.ix.searcher() as searcher:
-            query = QueryParser("text", self.ix.schema).parse(query_str)
-            results = searcher.search(query, limit=top_n)
+        The filters are applied by the index (see business_filter), and an
+        empty query_str matches every business. facets names keyword fields
+        (categories, attributes or hours) whose value counts over all matching
+        businesses are returned, most frequent first.
+        """
+        with self._searcher() as searcher:
+            with metrics.timer("search.query_parse"):
+                text_query = QueryParser("name", self.ix.schema).parse(query_str) if query_str else query.Every()
+                filter_query = business_filter(category, min_stars, is_open, open_at, attributes)
+            groupedby = {facet: sorting.FieldFacet(facet, allow_overlap=True) for facet in facets}
+            with metrics.timer("search.search"):
+                results = searcher.search(text_query, limit=top_n, filter=filter_query, groupedby=groupedby or None,
+                                          maptype=sorting.Count)
+                total = len(results)
+            with metrics.timer("search.stored_fields"):
+                hits = [dict(result.fields(), score=result.score, docnum=result.docnum) for result in results]
+            # Businesses without a value for a facet are grouped under None, leave them out
+            facet_counts = {facet: dict(sorted(((value, count) for value, count in results.groups(facet).items()
+                                                if value is not None), key=lambda item: (-item[1], item[0])))
+                            for facet in facets}
+            metrics.incr("search.docs_matched", total)
+            return {"total": total, "hits": hits, "facets": facet_counts}
 
-            print(f"Found {len(results)} results for review search:")
-            for i, result in enumerate(results):
-                print(f"Rank {i + 1}, Score: {result.score}, DocID: {result.docnum}")
-                print(f"Review: {result['text']}\n")
+    def search_review(self, query_str, top_n):
+        """Search for reviews by content, returning the total hit count and the top_n hits"""
+        with self._searcher() as searcher:
+            with metrics.timer("search.query_parse"):
+                query = QueryParser("text", self.ix.schema).parse(query_str)
+            with metrics.timer("search.search"):
+                results = searcher.search(query, limit=top_n)
+                total = len(results)
+            with metrics.timer("search.stored_fields"):
+                hits = [dict(result.fields(), score=result.score, docnum=result.docnum) for result in results]
+            attach_texts(self.text_store, hits)
+            metrics.incr("search.docs_matched", total)
+            return {"total": total, "hits": hits}
 
 class GeoSearch:
-    def __init__(self, index_dir):
+    def __init__(self, index_dir, pool=None):
         self.index_dir = index_dir
+        self.pool = pool
         self.R = 6371.0  # Earth's radius in kilometers
+        self._coordinates = None  # CoordinateTable of the latest index generation seen, loaded on first use
 
     def haversine(self, lat1, lon1, lat2, lon2):
         """Calculate the great circle distance between two points on Earth"""
@@ -43,32 +103,160 @@ class GeoSearch:
         c = 2 * atan2(sqrt(a), sqrt(1 - a))
         return self.R * c  # Returns distance in kilometers
 
+    def _open_index(self):
+        if self.pool:
+            return self.pool.ix
+        return index.open_dir(self.index_dir, indexname="business_index")
+
+    def _searcher(self):
+        if self.pool:
+            return self.pool.searcher()
+        return self._open_index().searcher(weighting=scoring.BM25F())
+
+    def _coordinates_for(self, reader):
+        """Return the coordinate arrays matching the docnums of reader, reloading them after a new commit"""
+        table = self._coordinates
+        if table is None or table.generation != reader.generation():
+            # NumPy is only loaded once a geo query needs the coordinate arrays
+            from yelp_geo_arrays import CoordinateTable
+            with metrics.timer("geo.load_coordinates"):
+                if has_coordinate_columns(reader):
+                    table = CoordinateTable.from_columns(reader)
+                else:
+                    table = CoordinateTable.from_stored_fields(reader)
+            self._coordinates = table
+        return table
+
+    def coordinates(self):
+        """Return the business coordinates of the latest index generation as a CoordinateTable"""
+        with self._searcher() as searcher:
+            return self._coordinates_for(searcher.reader())
+
+    def business_locations(self, business_ids):
+        """Resolve many business IDs to (latitude, longitude) in one call.
+
+        The location table is loaded once and reloaded only when the business
+        index has a new commit. Unknown IDs are left out.
+        """
+        locations = self.coordinates().locations
+        return {business_id: locations[business_id] for business_id in business_ids if business_id in locations}
+
+    def radius_search_many(self, points, radius_km):
+        """Return, for each (latitude, longitude) point, the (business_id, distance) pairs within radius_km.
+
+        All points are served by one vectorized pass over the coordinate
+        arrays, nearest first per point, without reading stored fields.
+        """
+        table = self.coordinates()
+        lats = [float(lat) for lat, _ in points]
+        lons = [float(lon) for _, lon in points]
+        with metrics.timer("geo.radius_search_many"):
+            results = table.within_many(lats, lons, radius_km)
+        return [list(zip(table.business_ids[docnums].tolist(), distances.tolist())) for docnums, distances in results]
+
+    def activity_areas(self, user_business_ids):
+        """Return the (min_lat, max_lat, min_lon, max_lon) bounding box of the businesses of many users.
+
+        user_business_ids maps each user to the business IDs they reviewed.
+        Users without a known business get (inf, -inf, inf, -inf).
+        """
+        from yelp_geo_arrays import bounding_boxes
+        locations = self.coordinates().locations
+        users = list(user_business_ids)
+        groups, lats, lons = [], [], []
+        for group, user in enumerate(users):
+            for business_id in user_business_ids[user]:
+                location = locations.get(business_id)
+                if location is not None:
+                    groups.append(group)
+                    lats.append(location[0])
+                    lons.append(location[1])
+        with metrics.timer("geo.activity_areas"):
+            boxes = bounding_boxes(groups, lats, lons, len(users))
+        return {user: tuple(box) for user, box in zip(users, boxes.tolist())}
+
+    def _spatial_query(self, lat, lon, radius_km):
+        """Build a query matching the geohash cells that cover a search circle"""
+        cells = covering_cells(lat, lon, radius_km)
+        return query.Or([query.Prefix("geohash", cell) for cell in cells])
+
+    def _search_within(self, searcher, lat, lon, radius_km):
+        """Fetch candidate businesses from the covering cells and refine their distances.
+
+        Only the candidates' coordinates are read, from the coordinate columns
+        when the index has them, and stored fields only for the matches.
+        """
+        with metrics.timer("geo.search"):
+            docnums = list(searcher.docs_for_query(self._spatial_query(lat, lon, radius_km)))
+        reader = searcher.reader()
+        if has_coordinate_columns(reader):
+            lats, lons = reader.column_reader("latitude_column"), reader.column_reader("longitude_column")
+            locations = ((docnum, lats[docnum], lons[docnum]) for docnum in docnums)
+        else:
+            stored = (searcher.stored_fields(docnum) for docnum in docnums)
+            locations = ((docnum, fields["latitude"], fields["longitude"]) for docnum, fields in zip(docnums, stored))
+        inside = []
+        for docnum, doc_lat, doc_lon in locations:
+            distance = self.haversine(lat, lon, doc_lat, doc_lon)
+            if distance <= radius_km:
+                inside.append((distance, docnum))
+        inside.sort()
+        with metrics.timer("geo.stored_fields"):
+            matches = [dict(searcher.stored_fields(docnum), distance=distance, docnum=docnum)
+                       for distance, docnum in inside]
+        metrics.incr("geo.docs_scanned", len(docnums))
+        metrics.incr("geo.docs_matched", len(matches))
+        return matches
+
     def geospatial_search(self, lat, lon, radius_km):
-        """Perform geospatial search"""
-        ix = index.open_dir(self.index_dir, indexname="business_index")
-        with ix.searcher(weighting=scoring.BM25F()) as searcher:
-            results = searcher.documents()  # Get all businesses
-            for result in results:
-                distance = self.haversine(lat, lon, result["latitude"], result["longitude"])
-                if distance <= radius_km:
-                    print(f"Business: {result['name']}, Distance: {distance:.2f} km")
-
-    def combined_search(self, query_str, lat, lon, radius_km):
-        """Perform combined text and geospatial search"""
-        ix = index.open_dir("indexdir")
-        with ix.searcher(weighting=scoring.BM25F()) as searcher:
-            parser = MultifieldParser(["review", "name"], schema=ix.schema)
-            query = parser.parse(query_str)
-            results = searcher.search(query, limit=50)
-
-            filtered_results = []
-            for result in results:
-                distance = self.haversine(lat, lon, result["latitude"], result["longitude"])
-                if distance <= radius_km:
-                    filtered_results.append((result, distance))
-                    print(f"Business: {result['name']}, Review: {result['review']}, Distance: {distance:.2f} km")
-
-            for i, (result, distance) in enumerate(filtered_results):
-                print(f"Rank {i + 1}, DocID: {result.docnum}, Score: {result.score}")
-                print(f"Business Name: {result['name']}, Distance: {distance:.2f} km")
-                print(f"Review: {result['review']}\n")
\ No newline at end of file
+        """Return businesses within radius_km of a point, nearest first"""
+        with self._searcher() as searcher:
+            return self._search_within(searcher, lat, lon, radius_km)
+
+    def nearest_search(self, lat, lon, k, max_radius_km=50.0):
+        """Return the k businesses nearest to a point, nearest first"""
+        with self._searcher() as searcher:
+            # Grow the search circle until it holds k businesses. Any business
+            # closer than the k-th match lies inside the circle, so the
+            # result is exact.
+            radius_km = 0.5
+            while True:
+                matches = self._search_within(searcher, lat, lon, radius_km)
+                if len(matches) >= k or radius_km >= max_radius_km:
+                    return matches[:k]
+                radius_km = min(radius_km * 2, max_radius_km)
+
+    def combined_search(self, query_str, lat, lon, radius_km, top_n=10, distance_weight=0.5):
+        """Return the top_n businesses matching a text query within radius_km of a point.
+
+        The BM25F query over name and category words only scores businesses in
+        the geohash cells covering the search circle. The final score blends
+        the normalized text score with an exponential distance decay.
+        """
+        with self._searcher() as searcher:
+            with metrics.timer("search.query_parse"):
+                # Indexes built before categories_text only have the case-sensitive categories keywords
+                category_field = "categories_text" if "categories_text" in searcher.schema else "categories"
+                parser = MultifieldParser(["name", category_field], schema=searcher.schema)
+                text_query = parser.parse(query_str)
+            with metrics.timer("search.search"):
+                results = searcher.search(text_query, filter=self._spatial_query(lat, lon, radius_km), limit=None)
+
+            matches = []
+            with metrics.timer("search.stored_fields"):
+                for result in results:
+                    distance = self.haversine(lat, lon, result["latitude"], result["longitude"])
+                    if distance <= radius_km:
+                        matches.append(dict(result.fields(), text_score=result.score, distance=distance,
+                                            docnum=result.docnum))
+            metrics.incr("geo.docs_scanned", len(results))
+            metrics.incr("geo.docs_matched", len(matches))
+
+        if not matches:
+            return []
+        max_text_score = max(match["text_score"] for match in matches) or 1.0
+        for match in matches:
+            text_part = match["text_score"] / max_text_score
+            distance_part = exp(-match["distance"] / radius_km) if radius_km > 0 else 1.0
+            match["score"] = (1 - distance_weight) * text_part + distance_weight * distance_part
+        return heapq.nlargest(top_n, matches, key=lambda match: match["score"])
@@ -0,0 +1,252 @@
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from whoosh.index import open_dir
+from yelp_searcher import YelpSearcher, GeoSearch
+from yelp_review_summarizer import YelpReviewSummarizer
+
+
+class SearcherPool:
+    """Pool of searchers over one index that stays open for the life of the service.
+
+    Searchers are created lazily, up to size, and handed to one request at a
+    time. A searcher is reopened only when the index has a new commit, which
+    is checked at most once every refresh_interval seconds.
+    """
+
+    def __init__(self, index_dir, indexname, size=4, refresh_interval=1.0):
+        self.ix = open_dir(index_dir, indexname=indexname)
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._generation = self.ix.latest_generation()
+        self._checked_at = time.time()
+
+    def generation(self):
+        """Return the latest commit generation of the index, re-read at most once per refresh_interval"""
+        now = time.time()
+        if now - self._checked_at >= self.refresh_interval:
+            self._generation = self.ix.latest_generation()
+            self._checked_at = now
+        return self._generation
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.ix.searcher(), self._generation
+        return self._idle.get()
+
+    @contextmanager
+    def searcher(self):
+        searcher, generation = self._acquire()
+        latest = self.generation()
+        if generation != latest:
+            searcher.close()
+            searcher, generation = self.ix.searcher(), latest
+        try:
+            yield searcher
+        finally:
+            self._idle.put((searcher, generation))
+
+    def close(self):
+        while True:
+            try:
+                searcher, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            searcher.close()
+
+
+class QueryCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, value) for a fresh cached entry, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def split_list(value):
+    """Split a comma-separated query parameter into its items"""
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+class YelpQueryService:
+    """Long-lived query service sharing open indexes, pooled searchers and a result cache"""
+
+    def __init__(self, index_dir_business, index_dir_review, pool_size=4, cache_size=1024, cache_ttl=300.0,
+                 profile_store_path=None):
+        self.business_pool = SearcherPool(index_dir_business, "business_index", size=pool_size)
+        self.review_pool = SearcherPool(index_dir_review, "review_index", size=pool_size)
+        self.business_searcher = YelpSearcher(index_dir_business, "business_index", pool=self.business_pool)
+        self.review_searcher = YelpSearcher(index_dir_review, "review_index", pool=self.review_pool)
+        self.geo_searcher = GeoSearch(index_dir_business, pool=self.business_pool)
+        self.summarizer = YelpReviewSummarizer(index_dir_review, index_dir_business,
+                                               profile_store_path=profile_store_path,
+                                               review_pool=self.review_pool, business_pool=self.business_pool)
+        self.cache = QueryCache(maxsize=cache_size, ttl=cache_ttl)
+        self.routes = {
+            "/search/business": self.search_business,
+            "/search/review": self.search_review,
+            "/search/geo": self.geospatial_search,
+            "/search/nearest": self.nearest_search,
+            "/search/combined": self.combined_search,
+            "/user/summary": self.user_summary,
+        }
+
+    def search_business(self, q="", top_n=10, category=None, min_stars=None, is_open=None, open_at=None,
+                        attributes=None, facets=None):
+        return self.business_searcher.search_business(
+            q, top_n=int(top_n), category=category,
+            min_stars=float(min_stars) if min_stars is not None else None,
+            is_open=is_open.lower() in ("1", "true", "yes") if is_open is not None else None,
+            open_at=open_at,
+            attributes=split_list(attributes),
+            facets=split_list(facets))
+
+    def search_review(self, q, top_n=10):
+        return self.review_searcher.search_review(q, top_n=int(top_n))
+
+    def geospatial_search(self, lat, lon, radius_km, top_n=None):
+        results = self.geo_searcher.geospatial_search(float(lat), float(lon), float(radius_km))
+        return results[:int(top_n)] if top_n else results
+
+    def nearest_search(self, lat, lon, k=10):
+        return self.geo_searcher.nearest_search(float(lat), float(lon), int(k))
+
+    def combined_search(self, q, lat, lon, radius_km, top_n=10):
+        return self.geo_searcher.combined_search(q, float(lat), float(lon), float(radius_km), top_n=int(top_n))
+
+    def user_summary(self, user_id):
+        return self.summarizer.get_user_review_summary(user_id)
+
+    def query(self, path, params):
+        """Run the query registered for path with the given parameters, serving repeats from the cache.
+
+        Raises KeyError for an unknown path, TypeError or ValueError for bad parameters.
+        """
+        handler = self.routes[path]
+        # Cached results are keyed on the index generations and the profile store version, so a new commit
+        # or a profile store update, even by another process, invalidates them
+        profile_store = self.summarizer.profile_store
+        key = (path, tuple(sorted(params.items())), self.business_pool.generation(), self.review_pool.generation(),
+               profile_store.version() if profile_store is not None else None)
+        hit, result = self.cache.get(key)
+        if not hit:
+            result = handler(**params)
+            self.cache.put(key, result)
+        return result
+
+    def close(self):
+        self.business_pool.close()
+        self.review_pool.close()
+
+
+def finite_json(value):
+    """Replace NaN and infinite floats, which JSON cannot represent, with None, e.g. the empty bounding box"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: finite_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite_json(item) for item in value]
+    return value
+
+
+class YelpRequestHandler(BaseHTTPRequestHandler):
+    """Serve GET /<route>?<params> as JSON from the server's YelpQueryService"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        service = self.server.service
+        if url.path not in service.routes:
+            self._send_json(404, {"error": f"Unknown route {url.path}"})
+            return
+        try:
+            result = service.query(url.path, params)
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.log_error("Error serving %s: %r", self.path, e)
+            traceback.print_exc()
+            self._send_json(500, {"error": "Internal server error"})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(finite_json(payload), default=str, allow_nan=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(service, host="127.0.0.1", port=8080):
+    server = ThreadingHTTPServer((host, port), YelpRequestHandler)
+    server.service = service
+    print(f"Serving Yelp queries on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Yelp search queries over HTTP/JSON.")
+    parser.add_argument("--index_dir_business", type=str, default="indexdir_business",
+                        help="Directory of the business index.")
+    parser.add_argument("--index_dir_review", type=str, default="indexdir_review",
+                        help="Directory of the review index.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument("--pool_size", type=int, default=4, help="Searchers kept open per index.")
+    parser.add_argument("--cache_size", type=int, default=1024, help="Maximum number of cached query results.")
+    parser.add_argument("--cache_ttl", type=float, default=300.0, help="Seconds a cached query result stays valid.")
+    parser.add_argument("--profile_store", type=str, default=None,
+                        help="Optional user profile store for fast user summaries.")
+    args = parser.parse_args()
+
+    serve(YelpQueryService(args.index_dir_business, args.index_dir_review, pool_size=args.pool_size,
+                           cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+                           profile_store_path=args.profile_store),
+          host=args.host, port=args.port)
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import random
+import string
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+# Nashville downtown, the area covered by the real subset
+CENTER_LAT, CENTER_LON = 36.1627, -86.7816
+SPREAD_DEGREES = 0.15
+
+NAME_PREFIXES = ["Music City", "Broadway", "Gulch", "Midtown", "East Side", "Hillsboro", "Belmont", "Germantown",
+                 "Riverfront", "Capitol", "Printer's Alley", "Honky Tonk", "Cumberland", "Nolensville", "Sylvan"]
+NAME_SUFFIXES = ["Pizza", "Coffee", "Tacos", "BBQ", "Sushi", "Burgers", "Bistro", "Diner", "Bakery", "Grill",
+                 "Hot Chicken", "Cafe", "Salon", "Brewery", "Kitchen"]
+CATEGORIES = ["Restaurants", "Pizza", "Coffee & Tea", "Mexican", "Barbeque", "Sushi Bars", "Burgers", "American (New)",
+              "Breakfast & Brunch", "Bakeries", "Southern", "Cafes", "Hair Salons", "Breweries", "Nightlife", "Bars"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WORDS = ("the food was great and service friendly staff slow place nice coffee pizza burger taco sushi music "
+         "drinks price cheap expensive tasty fresh cold hot wait line table order menu dessert sauce spicy "
+         "chicken beer patio parking downtown atmosphere loud quiet clean dirty recommend again visit").split()
+COMPARISON_TEMPLATES = [
+    "The {aspect} here is better than {other}.",
+    "Honestly {other} has worse {aspect} compared to this place.",
+    "I think this is the best {aspect} in town, more than {other}.",
+    "Less crowded than {other} and the {aspect} is more consistent.",
+]
+ASPECTS = ["food", "service", "coffee", "pizza", "atmosphere", "price", "music"]
+
+
+def random_id(rng):
+    return "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=22))
+
+
+def make_business(rng, business_id):
+    """Generate one record shaped like yelp_academic_dataset_business.json"""
+    name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)}"
+    hours = None
+    if rng.random() < 0.8:
+        opening, closing = rng.choice([(7, 15), (10, 22), (11, 23), (17, 2), (0, 0)])
+        hours = {day: f"{opening}:0-{closing}:0" for day in DAYS if rng.random() < 0.85}
+    attributes = None
+    if rng.random() < 0.7:
+        attributes = {
+            "RestaurantsDelivery": rng.choice(["True", "False"]),
+            "WiFi": rng.choice(["u'free'", "u'no'", "'paid'"]),
+            "OutdoorSeating": rng.choice(["True", "False"]),
+        }
+    return {
+        "business_id": business_id,
+        "name": name,
+        "address": f"{rng.randint(1, 9999)} {rng.choice(NAME_PREFIXES)} Ave",
+        "city": "Nashville",
+        "state": "TN",
+        "postal_code": str(rng.randint(37201, 37250)),
+        "latitude": CENTER_LAT + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        "longitude": CENTER_LON + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        "stars": rng.choice([1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]),
+        "review_count": rng.randint(5, 2000),
+        "is_open": int(rng.random() < 0.8),
+        "attributes": attributes,
+        "categories": ", ".join(rng.sample(CATEGORIES, rng.randint(1, 4))) if rng.random() < 0.95 else None,
+        "hours": hours,
+    }
+
+
+def make_review_text(rng, other_name, comparison_rate):
+    sentences = []
+    for _ in range(rng.randint(2, 8)):
+        words = rng.choices(WORDS, k=rng.randint(5, 20))
+        sentences.append(" ".join(words).capitalize() + ".")
+    if other_name and rng.random() < comparison_rate:
+        template = rng.choice(COMPARISON_TEMPLATES)
+        sentences.insert(rng.randrange(len(sentences) + 1), template.format(other=other_name, aspect=rng.choice(ASPECTS)))
+    return " ".join(sentences)
+
+
+def generate_dataset(output_dir, num_reviews, num_businesses=None, num_users=None, comparison_rate=0.05, seed=42):
+    """Write synthetic business and review JSON lines files, returning their paths.
+
+    Reviews follow a skewed user activity distribution, and some of them
+    mention by name another business the same user reviewed earlier, so the
+    comparison detection has work to do.
+    """
+    rng = random.Random(seed)
+    num_businesses = num_businesses or max(num_reviews // 20, 10)
+    num_users = num_users or max(num_reviews // 5, 10)
+    os.makedirs(output_dir, exist_ok=True)
+    business_path = os.path.join(output_dir, "synthetic_business.json")
+    review_path = os.path.join(output_dir, "synthetic_review.json")
+
+    business_ids = []
+    business_names = []
+    with open(business_path, "w", encoding="utf-8") as f:
+        for _ in range(num_businesses):
+            business = make_business(rng, random_id(rng))
+            business_ids.append(business["business_id"])
+            business_names.append(business["name"])
+            f.write(json.dumps(business) + "\n")
+
+    user_ids = [random_id(rng) for _ in range(num_users)]
+    # Zipf-like user activity: a few users write most reviews
+    user_weights = list(accumulate(1.0 / (rank + 1) for rank in range(num_users)))
+    users = range(num_users)
+    last_business = {}  # user index -> index of the last business the user reviewed
+    start_date = datetime(2010, 1, 1)
+    with open(review_path, "w", encoding="utf-8") as f:
+        for _ in range(num_reviews):
+            user = rng.choices(users, cum_weights=user_weights)[0]
+            business = rng.randrange(num_businesses)
+            previous = last_business.get(user)
+            other_name = business_names[previous] if previous is not None and previous != business else None
+            last_business[user] = business
+            review = {
+                "review_id": random_id(rng),
+                "user_id": user_ids[user],
+                "business_id": business_ids[business],
+                "stars": rng.randint(1, 5),
+                "useful": rng.randint(0, 10),
+                "funny": rng.randint(0, 5),
+                "cool": rng.randint(0, 5),
+                "text": make_review_text(rng, other_name, comparison_rate),
+                "date": (start_date + timedelta(seconds=rng.randrange(12 * 365 * 86400))).strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            f.write(json.dumps(review) + "\n")
+
+    return business_path, review_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Yelp-shaped business and review data.")
+    parser.add_argument("--output_dir", type=str, default="synthetic_dataset", help="Directory for the JSON files.")
+    parser.add_argument("--num_reviews", type=int, default=10000, help="Number of reviews to generate.")
+    parser.add_argument("--num_businesses", type=int, default=None,
+                        help="Number of businesses (defaults to num_reviews / 20).")
+    parser.add_argument("--num_users", type=int, default=None, help="Number of users (defaults to num_reviews / 5).")
+    parser.add_argument("--comparison_rate", type=float, default=0.05,
+                        help="Fraction of reviews mentioning another business the user reviewed.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    args = parser.parse_args()
+
+    paths = generate_dataset(args.output_dir, args.num_reviews, args.num_businesses, args.num_users,
+                             args.comparison_rate, args.seed)
+    print(f"Wrote {paths[0]} and {paths[1]}")
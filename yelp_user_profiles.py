@@ -0,0 +1,264 @@
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from whoosh.index import open_dir
+from whoosh.reading import TermNotFound
+from yelp_docstore import attach_texts, open_text_store
+from yelp_nltk import english_stopwords, sent_tokenize
+from yelp_searcher import GeoSearch
+
+MAX_STORED_TERMS = 100  # Term frequencies kept per user in the profile store
+
+
+def build_user_profile(texts, locations, stop_words, num_words=10, num_sentences=3, bounding_box=None):
+    """Summarize one user's reviews: count, activity area, frequent words and representative sentences.
+
+    A bounding_box computed in bulk (see GeoSearch.activity_areas) replaces the one derived from locations.
+    """
+    if bounding_box is None:
+        lats = [lat for lat, _ in locations]
+        lons = [lon for _, lon in locations]
+        bounding_box = (min(lats, default=float('inf')), max(lats, default=float('-inf')),
+                        min(lons, default=float('inf')), max(lons, default=float('-inf')))
+
+    # Get frequent words and phrases
+    word_counts = Counter(word for text in texts for word in (w.lower() for w in text.split())
+                          if word not in stop_words)
+    top_words = word_counts.most_common(num_words)
+
+    # Get representative sentences (simple method: choose sentences containing the most frequent words)
+    sentences = sent_tokenize(" ".join(texts))
+    sentence_scores = [(sentence, sum(word in sentence.lower() for word, _ in top_words)) for sentence in sentences]
+    representative_sentences = sorted(sentence_scores, key=lambda x: x[1], reverse=True)[:num_sentences]
+
+    return {
+        "review_count": len(texts),
+        "bounding_box": bounding_box,
+        "top_words": top_words,
+        "representative_sentences": [sentence for sentence, _ in representative_sentences],
+        "word_counts": word_counts
+    }
+
+
+def in_review_order(reviews):
+    """Sort a user's reviews oldest first, so stored and live summaries pick the same tied sentences"""
+    return sorted(reviews, key=lambda review: (review['date'], review['review_id']))
+
+
+def _live_docnums(reader, fieldname, text):
+    try:
+        return [docnum for docnum in reader.postings(fieldname, text).all_ids() if not reader.is_deleted(docnum)]
+    except TermNotFound:
+        return []
+
+
+class YelpUserProfileStore:
+    """SQLite store of precomputed per-user review summaries.
+
+    build() computes every profile in one pass over the review index, and
+    update() recomputes only the users whose reviews were added, changed or
+    deleted since the last run, or who reviewed a business that moved. The
+    store remembers which index segments it has profiled, so an update reads
+    only the segments written and the deletions made since the last run.
+    """
+
+    def __init__(self, db_path, index_dir_review, index_dir_business, stop_words=None):
+        self.db_path = db_path
+        self.index_dir_review = index_dir_review
+        self.index_dir_business = index_dir_business
+        # None uses NLTK's English stop words, loaded by the first profile build rather than here
+        self.stop_words = stop_words
+        self.geo_searcher = GeoSearch(index_dir_business)
+        # The HTTP service shares the store between request threads, so every use of the connection holds the lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(profiled_reviews)")]
+        if columns and "segment_id" not in columns:
+            # Stores written before segments were tracked are rebuilt by the next update
+            self.conn.executescript("""
+                DROP TABLE users; DROP TABLE user_terms; DROP TABLE user_sentences; DROP TABLE profiled_reviews;
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY, review_count INTEGER,
+                min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL);
+            CREATE TABLE IF NOT EXISTS user_terms (
+                user_id TEXT, rank INTEGER, term TEXT, count INTEGER, PRIMARY KEY (user_id, rank));
+            CREATE TABLE IF NOT EXISTS user_sentences (
+                user_id TEXT, rank INTEGER, sentence TEXT, PRIMARY KEY (user_id, rank));
+            CREATE TABLE IF NOT EXISTS profiled_reviews (
+                review_id TEXT PRIMARY KEY, user_id TEXT, content_hash TEXT, segment_id TEXT);
+            CREATE INDEX IF NOT EXISTS profiled_reviews_segment ON profiled_reviews (segment_id);
+            CREATE TABLE IF NOT EXISTS profiled_segments (segment_id TEXT PRIMARY KEY, deleted_count INTEGER);
+            CREATE TABLE IF NOT EXISTS profiled_businesses (business_id TEXT PRIMARY KEY, latitude REAL, longitude REAL);
+            CREATE TABLE IF NOT EXISTS profiled_generations (indexname TEXT PRIMARY KEY, generation INTEGER);
+        """)
+
+    def version(self):
+        """Return a value that changes whenever the stored profiles do, from this or another process"""
+        with self._lock:
+            # data_version changes on commits by other connections, total_changes on this connection's own
+            return self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def build(self):
+        """Rebuild every user profile from the review index"""
+        with self._lock, self.conn:
+            for table in ("users", "user_terms", "user_sentences", "profiled_reviews", "profiled_segments",
+                          "profiled_businesses", "profiled_generations"):
+                self.conn.execute(f"DELETE FROM {table}")
+        return self.update()
+
+    def update(self):
+        """Recompute the profiles of users whose reviews or businesses changed since the last run"""
+        start_time = time.time()
+        ix = open_dir(self.index_dir_review, indexname="review_index")
+        text_store = open_text_store(ix, self.index_dir_review)
+        with ix.reader() as reader, self._lock, self.conn:
+            segments = [(offset, segreader.segment()) for segreader, offset in reader.leaf_readers()]
+            affected = self._users_with_changed_reviews(reader, segments)
+            affected |= self._users_with_moved_businesses(reader)
+
+            user_docnums = {user_id: _live_docnums(reader, "user_id", user_id) for user_id in affected}
+
+            # Activity areas of all affected users in one vectorized pass
+            business_columns = reader.column_reader("business_id")
+            areas = self.geo_searcher.activity_areas({
+                user_id: {business_columns[docnum] for docnum in docnums}
+                for user_id, docnums in user_docnums.items()})
+
+            offsets = [offset for offset, _ in segments]
+            hashes = reader.column_reader("content_hash")
+            for user_id, docnums in user_docnums.items():
+                reviews = attach_texts(text_store, [reader.stored_fields(docnum) for docnum in docnums])
+                for review, docnum in zip(reviews, docnums):
+                    # The content hash is not stored, only kept in its column
+                    review['content_hash'] = hashes[docnum]
+                    review['segment_id'] = segments[bisect_right(offsets, docnum) - 1][1].segment_id()
+                self._write_profile(user_id, in_review_order(reviews), areas[user_id])
+
+            self.conn.execute("DELETE FROM profiled_segments")
+            self.conn.executemany("INSERT INTO profiled_segments VALUES (?, ?)",
+                                  [(segment.segment_id(), segment.deleted_count()) for _, segment in segments])
+
+        print(f"User profiles updated: {len(affected)} users in {time.time() - start_time:.2f} seconds")
+        return len(affected)
+
+    def _users_with_changed_reviews(self, reader, segments):
+        """Find the users with a review added, changed or deleted since the segments last profiled"""
+        known_segments = dict(self.conn.execute("SELECT segment_id, deleted_count FROM profiled_segments"))
+        review_ids = reader.column_reader("review_id")
+        user_ids = reader.column_reader("user_id")
+        hashes = reader.column_reader("content_hash")
+        affected = set()
+
+        # Reviews in new segments are new or rewritten, or were moved unchanged by a merge
+        for offset, segment in segments:
+            segment_id = segment.segment_id()
+            if segment_id in known_segments:
+                continue
+            moved = []
+            for docnum in range(offset, offset + segment.doc_count_all()):
+                if reader.is_deleted(docnum):
+                    continue
+                review_id, user_id = review_ids[docnum], user_ids[docnum]
+                profiled = self.conn.execute("SELECT user_id, content_hash FROM profiled_reviews WHERE review_id = ?",
+                                             (review_id,)).fetchone()
+                if profiled == (user_id, hashes[docnum]):
+                    moved.append((segment_id, review_id))
+                else:
+                    affected.add(user_id)
+                    if profiled is not None:
+                        affected.add(profiled[0])
+            self.conn.executemany("UPDATE profiled_reviews SET segment_id = ? WHERE review_id = ?", moved)
+
+        # Reviews still recorded in a segment that was merged away or lost documents were deleted
+        current = {segment.segment_id(): (offset, segment) for offset, segment in segments}
+        for segment_id, deleted_count in known_segments.items():
+            if segment_id not in current:
+                affected.update(user_id for user_id, in self.conn.execute(
+                    "SELECT DISTINCT user_id FROM profiled_reviews WHERE segment_id = ?", (segment_id,)))
+            elif current[segment_id][1].deleted_count() != deleted_count:
+                offset, segment = current[segment_id]
+                for docnum in segment.deleted_docs():
+                    profiled = self.conn.execute(
+                        "SELECT user_id FROM profiled_reviews WHERE review_id = ? AND segment_id = ?",
+                        (review_ids[offset + docnum], segment_id)).fetchone()
+                    if profiled is not None:
+                        affected.add(profiled[0])
+        return affected
+
+    def _users_with_moved_businesses(self, reader):
+        """Find the users who reviewed a business added, moved or deleted since the last run"""
+        business_ix = open_dir(self.index_dir_business, indexname="business_index")
+        generation = business_ix.latest_generation()
+        known_generation = self.conn.execute("SELECT generation FROM profiled_generations WHERE indexname = ?",
+                                             ("business_index",)).fetchone()
+        if known_generation == (generation,):
+            return set()
+
+        locations = self.geo_searcher.coordinates().locations
+        known = {business_id: (lat, lon) for business_id, lat, lon
+                 in self.conn.execute("SELECT business_id, latitude, longitude FROM profiled_businesses")}
+        changed = {business_id for business_id, location in locations.items() if known.get(business_id) != location}
+        changed |= known.keys() - locations.keys()
+
+        user_ids = reader.column_reader("user_id")
+        affected = {user_ids[docnum] for business_id in changed
+                    for docnum in _live_docnums(reader, "business_id", business_id)}
+
+        self.conn.executemany("DELETE FROM profiled_businesses WHERE business_id = ?",
+                              [(business_id,) for business_id in changed])
+        self.conn.executemany("INSERT INTO profiled_businesses VALUES (?, ?, ?)",
+                              [(business_id, *locations[business_id]) for business_id in changed
+                               if business_id in locations])
+        self.conn.execute("INSERT OR REPLACE INTO profiled_generations VALUES (?, ?)", ("business_index", generation))
+        return affected
+
+    def _write_profile(self, user_id, reviews, bounding_box):
+        for table in ("users", "user_terms", "user_sentences", "profiled_reviews"):
+            self.conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        if not reviews:
+            return
+
+        stop_words = self.stop_words if self.stop_words is not None else english_stopwords()
+        profile = build_user_profile([review['text'] for review in reviews], (), stop_words, bounding_box=bounding_box)
+
+        self.conn.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                          (user_id, profile["review_count"], *profile["bounding_box"]))
+        self.conn.executemany("INSERT INTO user_terms VALUES (?, ?, ?, ?)",
+                              [(user_id, rank, term, count) for rank, (term, count)
+                               in enumerate(profile["word_counts"].most_common(MAX_STORED_TERMS))])
+        self.conn.executemany("INSERT INTO user_sentences VALUES (?, ?, ?)",
+                              [(user_id, rank, sentence) for rank, sentence
+                               in enumerate(profile["representative_sentences"])])
+        # A review that moved to another user may still be recorded under its previous one
+        self.conn.executemany("INSERT OR REPLACE INTO profiled_reviews VALUES (?, ?, ?, ?)",
+                              [(review['review_id'], user_id, review['content_hash'], review['segment_id'])
+                               for review in reviews])
+
+    def get_summary(self, user_id, num_words=10):
+        """Return the stored summary of a user, or None if the user has no profile"""
+        with self._lock:
+            return self._read_summary(user_id, num_words)
+
+    def _read_summary(self, user_id, num_words):
+        row = self.conn.execute("SELECT review_count, min_lat, max_lat, min_lon, max_lon FROM users WHERE user_id = ?",
+                                (user_id,)).fetchone()
+        if row is None:
+            return None
+        top_words = self.conn.execute("SELECT term, count FROM user_terms WHERE user_id = ? ORDER BY rank LIMIT ?",
+                                      (user_id, num_words)).fetchall()
+        sentences = self.conn.execute("SELECT sentence FROM user_sentences WHERE user_id = ? ORDER BY rank",
+                                      (user_id,)).fetchall()
+        return {
+            "review_count": row[0],
+            "bounding_box": tuple(row[1:]),
+            "top_words": top_words,
+            "representative_sentences": [sentence for sentence, in sentences]
+        }